@@ -1,14 +1,19 @@
 import pandas as pd
 import numpy as np
 import streamlit as st
+import threading
+from collections import deque
 from pathlib import Path
 from datetime import datetime
-import plotly.express as px
-import plotly.graph_objects as go
-from backend.config import SENSOR_CSV, OPENAI_API_KEY
-from backend.retriever import retrieve
-from backend.models import train_anomaly_model, score_anomalies
-from backend.llm import llm_summarize
+from backend.config import SENSOR_CSV, SENSOR_STORE, SENSOR_BACKEND, OPENAI_API_KEY
+from backend.retriever import retrieve, get_service
+from backend.model_registry import get_registry
+from backend.streaming import StreamingScorer
+from backend.llm import llm_summarize, llm_summarize_stream
+from backend.stream_reader import SensorTail
+from backend.alert_pipeline import explain_alerts
+from backend.rollups import RollupStore, chart_frame, downsample
+from backend.metrics import metrics, span
 import subprocess, sys
 st.set_page_config(
     page_title="🏆 Smart Building RAG",
@@ -117,13 +122,75 @@ st.markdown(f"""
 </div>
 <div class="spacer"></div>
 """, unsafe_allow_html=True)
-@st.cache_data(show_spinner=False)
+@st.cache_resource(show_spinner=False)
+def get_sensor_tail(path: str):
+    return SensorTail(path, maxlen=5000)
+
+@st.cache_resource(show_spinner=False)
+def get_scorer():
+    return StreamingScorer(get_registry())
+
+@st.cache_resource(show_spinner=False)
+def get_rollups():
+    return RollupStore()
+
+@st.cache_resource(show_spinner=False)
+def get_unscored():
+    # rows wait here for the Alerts tab, so sklearn is imported after the KPIs are on screen
+    return deque()
+
+def score_pending():
+    pending = get_unscored()
+    batches = []
+    while pending:
+        batches.append(pending.popleft())
+    if batches:
+        get_scorer().push(pd.concat(batches, ignore_index=True))
+
+@st.cache_resource(show_spinner=False)
+def warm_retriever():
+    # open Chroma and load the embedder once per process, in the background while the page renders
+    def run():
+        try:
+            get_service().warm()
+        except Exception as e:
+            # the first query opens Chroma and the model again and reports the error to the user
+            print(f"Retriever warm-up failed: {e!r}", file=sys.stderr)
+    thread = threading.Thread(target=run, name="retriever-warmup", daemon=True)
+    thread.start()
+    return thread
+
+@st.cache_resource(show_spinner=False)
+def get_store(root: str):
+    from backend.tsstore import TimeSeriesStore
+    return TimeSeriesStore(root)
+
+@st.cache_resource(show_spinner=False)
+def get_store_tail(root: str, seconds: int = 3600):
+    from backend.tsstore import StoreTail
+    return StoreTail(get_store(root), seconds)
+
+def load_store_data(root: str, seconds: int = 3600):
+    # reads only rows stored since the last rerun; the last hour stays cached
+    tail = get_store_tail(root, seconds)
+    new_rows = tail.poll()
+    if len(new_rows):
+        get_unscored().append(new_rows)
+        get_rollups().update(new_rows)
+    return tail.frame()
+
 def load_data(path: str):
-    if Path(path).exists():
-        df = pd.read_csv(path, parse_dates=["timestamp"])
-        df = df.sort_values("timestamp")
-        return df
-    return None
+    with span("load_data"):
+        if SENSOR_BACKEND == "store":
+            return load_store_data(str(SENSOR_STORE))
+        # only rows appended since the last rerun are parsed
+        tail = get_sensor_tail(str(path))
+        new_rows = tail.poll()
+        if len(new_rows):
+            get_unscored().append(new_rows)
+            with span("rollups.update"):
+                get_rollups().update(new_rows)
+        return tail.frame()
 
 def format_num(x, unit=""):
     try:
@@ -135,7 +202,11 @@ with st.sidebar:
     with st.expander("📦 Data"):
         if st.button("Generate Sample Data", use_container_width=True):
             with st.spinner("⏳ Generating sample data..."):
-                subprocess.run([sys.executable, "backend/data_simulator.py", "--rows", "1500", "--out", str(SENSOR_CSV)], check=True)
+                if SENSOR_BACKEND == "store":
+                    subprocess.run([sys.executable, "backend/data_simulator.py", "--devices", "3", "--seconds", "500",
+                                    "--format", "store", "--out", str(SENSOR_STORE)], check=True)
+                else:
+                    subprocess.run([sys.executable, "backend/data_simulator.py", "--rows", "1500", "--out", str(SENSOR_CSV)], check=True)
             st.success("✅ Sample data generated!")
     with st.expander("🏭 Filters", expanded=True):
         equipment_filter = st.selectbox("Equipment", ["", "hvac", "chiller", "building"])
@@ -145,6 +216,7 @@ with st.sidebar:
     with st.expander("ℹ️ About"):
         st.write("Interactive IoT/RAG dashboard with anomaly detection and retrieval‑augmented Q&A.")
         st.caption("Design: glassmorphism, animated background, and Plotly interactivity.")
+warmup = warm_retriever()
 df = load_data(SENSOR_CSV)
 if df is not None and len(df) > 0:
     latest = df.iloc[-1]
@@ -186,17 +258,28 @@ with tab1:
     if df is None or len(df) == 0:
         st.info("No sensor data found. Use **Generate Sample Data** from the sidebar.")
     else:
+        # plotly loads on the first chart, after the KPIs are painted
+        import plotly.express as px
+        import plotly.graph_objects as go
         st.markdown('<div class="section-card">', unsafe_allow_html=True)
         df_viz = df.copy()
         if equipment_filter:
             if 'equipment' in df_viz.columns:
                 df_viz = df_viz[df_viz['equipment'].str.lower() == equipment_filter.lower()]
+        windows = {"Last 800 rows": None, "1 hour": 3600, "1 day": 86400, "1 week": 7 * 86400}
+        window = st.selectbox("Window", list(windows), index=0)
+        if windows[window] is None:
+            chart_df = downsample(df_viz.tail(800), "timestamp", ["temp_c", "vibration", "power_kw"])
+        else:
+            # long windows come from the 1-min/15-min/hourly rollups, LTTB keeps it to ~2000 points per signal
+            chart_df = chart_frame(df_viz, get_rollups(), windows[window])
         fig = px.line(
-        df_viz.tail(800),
+        chart_df,
         x="timestamp",
-        y=["temp_c", "vibration", "power_kw"],
+        y="value",
+        color="signal",
         markers=False,
-        title="Sensor Trends (last 800 rows)",
+        title=f"Sensor Trends ({window.lower()})",
         color_discrete_map={
         "temp_c": "#00B5FF",
         "vibration":"#7FFF00",
@@ -212,18 +295,18 @@ with tab1:
         fig.update_traces(hovertemplate='%{y:.3f}<extra>%{fullData.name}</extra>')
         st.plotly_chart(fig, use_container_width=True)
         c1, c2, c3 = st.columns(3)
-        with c1:
-            hist1 = px.histogram(df_viz.tail(1000), x="temp_c", nbins=30, title="Temperature Distribution")
-            hist1.update_layout(template="plotly_dark", height=300, margin=dict(l=10,r=10,t=40,b=10))
-            st.plotly_chart(hist1, use_container_width=True)
-        with c2:
-            hist2 = px.histogram(df_viz.tail(1000), x="vibration", nbins=30, title="Vibration Distribution")
-            hist2.update_layout(template="plotly_dark", height=300, margin=dict(l=10,r=10,t=40,b=10))
-            st.plotly_chart(hist2, use_container_width=True)
-        with c3:
-            hist3 = px.histogram(df_viz.tail(1000), x="power_kw", nbins=30, title="Power Distribution")
-            hist3.update_layout(template="plotly_dark", height=300, margin=dict(l=10,r=10,t=40,b=10))
-            st.plotly_chart(hist3, use_container_width=True)
+        hist_src = df_viz.tail(1000)
+        for col, metric, title in ((c1, "temp_c", "Temperature Distribution"),
+                                   (c2, "vibration", "Vibration Distribution"),
+                                   (c3, "power_kw", "Power Distribution")):
+            with col:
+                # bin here and send 30 bars instead of the raw points
+                values = hist_src[metric].dropna().to_numpy()
+                counts, edges = np.histogram(values, bins=30) if len(values) else (np.zeros(0), np.zeros(1))
+                hist = go.Figure(go.Bar(x=(edges[:-1] + edges[1:]) / 2, y=counts, width=np.diff(edges)))
+                hist.update_layout(template="plotly_dark", height=300, margin=dict(l=10,r=10,t=40,b=10),
+                                   title=title, xaxis_title=metric, yaxis_title="count")
+                st.plotly_chart(hist, use_container_width=True)
 
         st.dataframe(df_viz.tail(300), use_container_width=True, height=280)
         st.markdown('</div>', unsafe_allow_html=True)
@@ -235,6 +318,8 @@ with tab2:
         run_retrieve = st.button("🔍 Retrieve Answer", use_container_width=True)
     with colq2:
         clear_q = st.button("🧹 Clear", use_container_width=True)
+    if warmup.is_alive():
+        st.caption("⏳ Loading the embedding model and index in the background...")
 
     if clear_q:
         st.experimental_rerun()
@@ -248,41 +333,48 @@ with tab2:
                     src = h['metadata'].get('source', 'Unknown')
                     st.markdown(f"<div class='section-card' style='margin-top:0.6rem'><b>📄 Source:</b> {src}<br>{h['text']}</div>", unsafe_allow_html=True)
                 if use_llm:
-                    with st.spinner("🤖 Drafting AI summary..."):
-                        summary = llm_summarize(q, [h['text'] for h in hits]) or "(No summary)"
                     st.markdown('<div class="ai-summary"><b>💡 AI Summary</b></div>', unsafe_allow_html=True)
-                    st.write(summary)
+                    texts, ids = [h['text'] for h in hits], [h['id'] for h in hits]
+                    if hasattr(st, "write_stream"):
+                        summary = st.write_stream(llm_summarize_stream(q, texts, context_ids=ids))
+                        if not summary:
+                            st.write("(No summary)")
+                    else:
+                        with st.spinner("🤖 Drafting AI summary..."):
+                            summary = llm_summarize(q, texts, context_ids=ids) or "(No summary)"
+                        st.write(summary)
             else:
                 st.warning("No matches found in the retriever.")
         else:
             st.warning("Please type a question first.")
     st.markdown('</div>', unsafe_allow_html=True)
 with tab3:
+    score_pending()
     if df is None or len(df) < 80:
         st.info("Generate data first to see alerts and anomaly scoring.")
     else:
+        import plotly.graph_objects as go
         st.markdown('<div class="section-card">', unsafe_allow_html=True)
-        df_train = df.tail(900)
-        df_score = df.tail(500).copy().reset_index(drop=True)
-        with st.spinner("🧠 Training anomaly model & scoring..."):
-            model = train_anomaly_model(df_train)
-            scores = score_anomalies(model, df_score)
-        df_score["anomaly_score"] = scores
-        threshold = float(np.percentile(scores, 98))
+        # rows are scored per device as they arrive, see load_data() and score_pending()
+        df_score = get_scorer().recent_scores(500)
+        if len(df_score) == 0:
+            st.info("Collecting enough rows per device to fit anomaly models...")
+            df_score = pd.DataFrame(columns=["timestamp","device_id","anomaly_score","threshold"])
         figA = go.Figure()
         figA.add_trace(go.Scatter(x=df_score["timestamp"], y=df_score["anomaly_score"],
                                   mode="lines", name="Anomaly Score"))
-        figA.add_hline(y=threshold, line_dash="dash", annotation_text="Threshold (98th pct)", annotation_position="top left")
+        figA.add_trace(go.Scatter(x=df_score["timestamp"], y=df_score["threshold"], mode="lines",
+                                  name="Threshold (98th pct, per device)", line=dict(dash="dash")))
         figA.update_layout(template="plotly_dark", height=360, title="Anomaly Scores (last 500 rows)",
                            margin=dict(l=10,r=10,t=50,b=10))
         st.plotly_chart(figA, use_container_width=True)
-        alerts = df_score[df_score["anomaly_score"] >= threshold].tail(12)
+        alerts = df_score[df_score["anomaly_score"] >= df_score["threshold"]].tail(12)
         if len(alerts) == 0:
             st.success("No anomalies above threshold. System looks healthy ✅")
         else:
             st.subheader("Recent Alerts")
             for _, row in alerts.iterrows():
-                score = row["anomaly_score"]
+                score, threshold = row["anomaly_score"], row["threshold"]
                 if score >= threshold * 1.25:
                     sev = "sev-high"; label = "🔴 High"
                 elif score >= threshold * 1.05:
@@ -302,7 +394,42 @@ with tab3:
                 alerts[["timestamp","device_id","anomaly_score"]].sort_values("anomaly_score", ascending=False),
                 use_container_width=True, height=250
             )
+            if st.button("🧠 Explain Alerts", use_container_width=True):
+                storm = df_score[df_score["anomaly_score"] >= df_score["threshold"]]
+                with st.spinner("🔎 Grouping alerts and retrieving remediation steps..."):
+                    groups = explain_alerts(storm, df, summarize=use_llm)
+                for g in groups:
+                    sources = ", ".join(sorted({h['metadata'].get('source', '?') for h in g.hits})) or "—"
+                    st.markdown(
+                        f"<div class='section-card' style='margin-top:0.6rem'>"
+                        f"<b>{g.query}</b><br>{g.count} alerts on {', '.join(g.device_ids[:8])}"
+                        f"{' …' if len(g.device_ids) > 8 else ''} | 📄 {sources}</div>", unsafe_allow_html=True
+                    )
+                    if g.summary:
+                        st.write(g.summary)
+                    elif g.hits:
+                        st.caption(g.hits[0]['text'])
         st.markdown('</div>', unsafe_allow_html=True)
+# rendered last so it includes the spans of this rerun
+with st.sidebar:
+    with st.expander("⏱ Performance"):
+        # metrics is one registry per server process, so this switches tracing for every session
+        metrics.enabled = st.toggle("Tracing (all sessions)", value=metrics.enabled,
+                                    help="Turns span recording on or off for the whole server, not just this session.")
+        perf = pd.DataFrame(metrics.summary())
+        if len(perf):
+            st.dataframe(perf.round(2), use_container_width=True, hide_index=True)
+            recent = pd.DataFrame(metrics.recent_spans(30))
+            st.caption("Recent spans")
+            st.dataframe(recent[["name", "parent", "ms"]].iloc[::-1].round(2), use_container_width=True,
+                         hide_index=True, height=200)
+            counters = metrics.counters()
+            if counters:
+                st.caption(" • ".join(f"{k}: {v:g}" for k, v in sorted(counters.items())))
+            st.download_button("Prometheus metrics", metrics.to_prometheus(), file_name="metrics.prom",
+                               mime="text/plain", use_container_width=True)
+        else:
+            st.caption("No spans recorded yet.")
 st.markdown("""
 <div class="footer">
   Built Using Streamlit • © Nervesparks
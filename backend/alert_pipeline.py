@@ -0,0 +1,134 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from typing import List, Optional
+
+import numpy as np
+import pandas as pd
+
+from backend.config import TOP_K, LLM_CONCURRENCY, LLM_RATE_PER_SEC
+
+FEATURE_LABELS = {
+    "temp_c": "temperature",
+    "vibration": "vibration",
+    "power_kw": "power draw",
+    "occupancy": "occupancy",
+}
+
+
+@dataclass
+class AlertGroup:
+    device_ids: List[str]
+    feature: str
+    direction: str
+    count: int
+    max_score: float
+    first_seen: object
+    last_seen: object
+    equipment: Optional[str]
+    query: str
+    hits: list = field(default_factory=list)
+    summary: Optional[str] = None
+
+
+class RateLimiter:
+    """Spaces calls at least 1/rate seconds apart across threads."""
+
+    def __init__(self, rate_per_sec: float):
+        self.interval = 1.0 / rate_per_sec if rate_per_sec > 0 else 0.0
+        self._next = 0.0
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        with self._lock:
+            now = time.monotonic()
+            wait = self._next - now
+            self._next = max(now, self._next) + self.interval
+        if wait > 0:
+            time.sleep(wait)
+
+
+def equipment_for_device(device_id: str) -> Optional[str]:
+    d = str(device_id).lower()
+    if d.startswith(("ahu", "hvac", "fcu", "vav")):
+        return "hvac"
+    if d.startswith(("ch", "chiller")):
+        return "chiller"
+    return None
+
+
+def dominant_features(alerts: pd.DataFrame, baseline: pd.DataFrame, features: List[str]) -> pd.DataFrame:
+    """Adds `feature`/`direction` columns: the feature furthest from its device's baseline, in std units."""
+    stats = baseline.groupby("device_id")[features].agg(["mean", "std"])
+    mean = stats.xs("mean", axis=1, level=1).reindex(alerts["device_id"]).to_numpy()
+    std = stats.xs("std", axis=1, level=1).reindex(alerts["device_id"]).to_numpy()
+    z = (alerts[features].to_numpy(dtype=float) - mean) / np.where(std > 0, std, 1.0)
+    z = np.nan_to_num(z)
+    idx = np.abs(z).argmax(axis=1)
+    picked = z[np.arange(len(z)), idx]
+    return alerts.assign(feature=np.asarray(features)[idx], direction=np.where(picked >= 0, "high", "low"))
+
+
+def group_alerts(alerts: pd.DataFrame, baseline: pd.DataFrame, features: List[str] = None,
+                 equipment: Optional[str] = None) -> List[AlertGroup]:
+    """Collapses alert rows into one group per equipment type x dominant feature x direction.
+
+    Devices of the same type with the same symptom share a group, so they end
+    up with a single retrieval query and a single summary.
+    """
+    if alerts is None or len(alerts) == 0:
+        return []
+    features = features or [f for f in FEATURE_LABELS if f in alerts.columns]
+    tagged = dominant_features(alerts, baseline, features)
+    tagged["equipment"] = equipment or tagged["device_id"].map(equipment_for_device)
+    groups = []
+    for (equip, feat, direction), g in tagged.groupby(
+            [tagged["equipment"].fillna(""), "feature", "direction"], sort=False):
+        label = FEATURE_LABELS.get(feat, feat)
+        kind = {"hvac": "AHU", "chiller": "chiller"}.get(equip, "equipment")
+        groups.append(AlertGroup(
+            device_ids=sorted(g["device_id"].astype(str).unique()),
+            feature=feat,
+            direction=direction,
+            count=len(g),
+            max_score=float(g["anomaly_score"].max()) if "anomaly_score" in g else float("nan"),
+            first_seen=g["timestamp"].min() if "timestamp" in g else None,
+            last_seen=g["timestamp"].max() if "timestamp" in g else None,
+            equipment=equip or None,
+            query=f"{kind} {label} is abnormally {direction}. What should I check first?",
+        ))
+    return sorted(groups, key=lambda grp: -grp.max_score)
+
+
+def explain_alerts(alerts: pd.DataFrame, baseline: pd.DataFrame, equipment: Optional[str] = None,
+                   k: int = TOP_K, summarize: bool = True, max_concurrency: int = LLM_CONCURRENCY,
+                   rate_per_sec: float = LLM_RATE_PER_SEC) -> List[AlertGroup]:
+    """Groups alerts, retrieves context for every group in one batch and
+    summarizes the groups concurrently under a rate limit."""
+    from backend.retriever import retrieve_many
+    from backend.llm import llm_summarize
+
+    groups = group_alerts(alerts, baseline, equipment=equipment)
+    if not groups:
+        return groups
+    hits = retrieve_many([g.query for g in groups], [g.equipment for g in groups], k)
+    for g, h in zip(groups, hits):
+        g.hits = h
+    if not summarize:
+        return groups
+
+    limiter = RateLimiter(rate_per_sec)
+
+    def _summarize(g: AlertGroup):
+        if not g.hits:
+            return None
+        question = f"{g.query} Affected devices: {', '.join(g.device_ids[:20])}."
+        # cached answers don't count against the rate limit
+        return llm_summarize(question, [h["text"] for h in g.hits], context_ids=[h["id"] for h in g.hits],
+                             before_request=limiter.acquire)
+
+    with ThreadPoolExecutor(max_workers=max(1, max_concurrency)) as pool:
+        for g, summary in zip(groups, pool.map(_summarize, groups)):
+            g.summary = summary
+    return groups
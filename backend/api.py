@@ -0,0 +1,234 @@
+import sys
+import pathlib
+sys.path.append(str(pathlib.Path(__file__).resolve().parent.parent))
+
+import asyncio
+import io
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import asynccontextmanager
+from typing import Dict, List, Optional, Union
+
+import numpy as np
+import pandas as pd
+from fastapi import FastAPI, HTTPException, Request
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import PlainTextResponse
+from pydantic import BaseModel
+
+from backend.config import SENSOR_CSV, SENSOR_STORE, SENSOR_BACKEND, TOP_K, API_WORKERS, MODEL_DIR
+from backend.data_simulator import FIELDNAMES, TS_FORMAT
+from backend.metrics import metrics
+from backend.stream_reader import SensorTail
+
+FEATURES = ["temp_c", "vibration", "power_kw", "occupancy"]
+DEFAULT_LIMITS = {"temp_c": 30.0, "vibration": 0.5, "power_kw": 25.0}
+
+
+class RetrieveRequest(BaseModel):
+    query: Optional[str] = None
+    queries: Optional[List[str]] = None
+    equipment: Optional[Union[str, List[Optional[str]]]] = None
+    k: int = TOP_K
+
+
+class SummarizeRequest(BaseModel):
+    question: str
+    contexts: Optional[List[str]] = None
+    context_ids: Optional[List[str]] = None
+    equipment: Optional[str] = None
+    k: int = TOP_K
+    max_tokens: int = 256
+
+
+# ---- Process-pool workers (must be importable top-level functions) ----
+def _warm_worker(model_dir: str):
+    # pool initializer: runs once in every worker, on the registry sharding's tasks use.
+    # It must not raise: a failing initializer breaks the whole pool.
+    try:
+        from backend.sharding import _worker_registry
+        _worker_registry(model_dir).load_all()
+    except Exception as e:
+        print(f"Model warm-up failed: {e}")
+
+
+class State:
+    tail: SensorTail
+    pool: ProcessPoolExecutor
+    write_lock: asyncio.Lock
+
+
+state = State()
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    state.tail = SensorTail(SENSOR_CSV, maxlen=5000)
+    # every worker loads the saved models as it starts; Chroma/embedder open in the background
+    state.pool = ProcessPoolExecutor(max_workers=API_WORKERS, initializer=_warm_worker, initargs=(MODEL_DIR,))
+    state.write_lock = asyncio.Lock()
+    # the executor starts workers on submit; start them now instead of on the first request
+    for _ in range(API_WORKERS):
+        state.pool.submit(int)
+    loop = asyncio.get_running_loop()
+    loop.run_in_executor(None, _warm_retriever)
+    yield
+    state.pool.shutdown(wait=False, cancel_futures=True)
+
+
+def _warm_retriever():
+    try:
+        from backend.retriever import get_service
+        get_service().warm()
+    except Exception as e:
+        print(f"Retriever warm-up failed: {e}")
+
+
+app = FastAPI(title="Smart Building IoT RAG", lifespan=lifespan)
+
+
+@app.middleware("http")
+async def time_requests(request: Request, call_next):
+    if not metrics.enabled:
+        return await call_next(request)
+    # observe() rather than span(): concurrent requests interleave on the event loop thread
+    start = time.perf_counter()
+    response = await call_next(request)
+    # label by route template, not the raw path, so unknown paths can't create new series
+    matched = request.scope.get("route")
+    route = getattr(matched, "path", None) or "unmatched"
+    metrics.observe("http_request", time.perf_counter() - start, path=route)
+    metrics.inc("http_responses", path=route, status=response.status_code)
+    return response
+
+
+def _append_rows(df: pd.DataFrame) -> int:
+    # timestamps are already parsed, validated and converted to naive UTC by ingest()
+    if SENSOR_BACKEND == "store":
+        from backend.tsstore import TimeSeriesStore
+        return TimeSeriesStore(SENSOR_STORE).write(df)
+    path = str(SENSOR_CSV)
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    new_file = not os.path.exists(path) or os.path.getsize(path) == 0
+    df = df.reindex(columns=FIELDNAMES)
+    df["timestamp"] = df["timestamp"].dt.strftime(TS_FORMAT)
+    with open(path, "a", newline="") as f:
+        df.to_csv(f, header=new_file, index=False)
+    return len(df)
+
+
+def _records(df: pd.DataFrame) -> List[dict]:
+    # JSON has no NaN/inf, send them as null
+    df = df.replace([np.inf, -np.inf], np.nan)
+    return df.astype(object).where(df.notna(), None).to_dict("records")
+
+
+def _recent(device_id: Optional[str], window: int, per_device: bool = False) -> pd.DataFrame:
+    if SENSOR_BACKEND == "store":
+        from backend.tsstore import TimeSeriesStore
+        df = TimeSeriesStore(SENSOR_STORE).tail(3600, devices=[device_id] if device_id else None)
+    else:
+        state.tail.poll()
+        df = state.tail.device_frame(device_id) if device_id else state.tail.frame()
+    if df is None or len(df) == 0:
+        raise HTTPException(status_code=404, detail="No sensor data")
+    if per_device and "device_id" in df.columns:
+        # the last `window` rows of every device, still in time order
+        return df.groupby("device_id", sort=False).tail(window).reset_index(drop=True)
+    return df.tail(window).reset_index(drop=True)
+
+
+@app.get("/health")
+async def health():
+    return {"status": "ok"}
+
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def prometheus_metrics():
+    # spans recorded inside the process-pool workers (/anomalies scoring) stay in those processes
+    return PlainTextResponse(metrics.to_prometheus(), media_type="text/plain; version=0.0.4")
+
+
+@app.post("/ingest")
+async def ingest(request: Request):
+    body = await request.body()
+    ctype = request.headers.get("content-type", "")
+    try:
+        if "csv" in ctype:
+            df = await run_in_threadpool(pd.read_csv, io.BytesIO(body))
+        else:
+            payload = await request.json()
+            rows = payload.get("rows", payload) if isinstance(payload, dict) else payload
+            df = pd.DataFrame(rows if isinstance(rows, list) else [rows])
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=f"Could not parse body: {e}")
+    missing = {"timestamp", "device_id"} - set(df.columns)
+    if missing:
+        raise HTTPException(status_code=422, detail=f"Missing columns: {sorted(missing)}")
+    # utc=True: a body may mix offsets ("+02:00", "Z", none); naive timestamps are taken as UTC
+    ts = pd.to_datetime(df["timestamp"], format="ISO8601", errors="coerce", utc=True)
+    bad = np.flatnonzero(ts.isna().to_numpy())
+    if len(bad):
+        rows = [{"row": int(i), "timestamp": None if pd.isna(v) else str(v)}
+                for i, v in zip(bad[:20], df["timestamp"].iloc[bad[:20]])]
+        raise HTTPException(status_code=422, detail={"error": f"{len(bad)} rows with an invalid timestamp",
+                                                     "rows": rows})
+    # stored as naive UTC, the format the CSV and the store already hold
+    df["timestamp"] = ts.dt.tz_localize(None)
+    async with state.write_lock:
+        n = await run_in_threadpool(_append_rows, df)
+    return {"ingested": n}
+
+
+@app.get("/anomalies")
+async def anomalies(device_id: Optional[str] = None, window: int = 500, train_rows: int = 900):
+    from backend.model_registry import get_registry
+    from backend.sharding import score_fleet
+    # each device's model is keyed by train_rows, so it gets that many of its own rows
+    df = await run_in_threadpool(_recent, device_id, max(window, train_rows), True)
+    # devices are sharded over the pool; features travel through shared memory, not pickled frames
+    scores = await run_in_threadpool(score_fleet, df, FEATURES, train_rows, get_registry(),
+                                     API_WORKERS, state.pool)
+    df = df.assign(anomaly_score=scores).tail(window)
+    df["timestamp"] = df["timestamp"].astype(str)
+    return {"rows": _records(df)}
+
+
+@app.get("/rul")
+async def rul(device_id: Optional[str] = None, window: int = 50,
+              temp_c: float = DEFAULT_LIMITS["temp_c"], vibration: float = DEFAULT_LIMITS["vibration"],
+              power_kw: float = DEFAULT_LIMITS["power_kw"]):
+    from backend.models import fleet_rul
+    df = await run_in_threadpool(_recent, device_id, 5000)
+    limits: Dict[str, float] = {"temp_c": temp_c, "vibration": vibration, "power_kw": power_kw}
+    out = await run_in_threadpool(fleet_rul, df, limits, window)
+    # null rul_steps means "no upward trend" or "not enough points"
+    return {"rows": _records(out)}
+
+
+@app.post("/retrieve")
+async def retrieve(req: RetrieveRequest):
+    from backend.retriever import retrieve_many
+    queries = req.queries or ([req.query] if req.query else [])
+    if not queries:
+        raise HTTPException(status_code=422, detail="query or queries is required")
+    results = await run_in_threadpool(retrieve_many, queries, req.equipment, req.k)
+    return {"results": results if req.queries else results[0]}
+
+
+@app.post("/summarize")
+async def summarize(req: SummarizeRequest):
+    from backend.llm import allm_summarize
+    contexts, ids = req.contexts, req.context_ids
+    if not contexts:
+        from backend.retriever import retrieve_many
+        hits = (await run_in_threadpool(retrieve_many, [req.question], req.equipment, req.k))[0]
+        contexts, ids = [h["text"] for h in hits], [h["id"] for h in hits]
+    summary = await allm_summarize(req.question, contexts, req.max_tokens, context_ids=ids)
+    return {"summary": summary, "context_ids": ids}
+
+
+if __name__ == "__main__":
+    import uvicorn
+    uvicorn.run("backend.api:app", host=os.getenv("API_HOST", "0.0.0.0"), port=int(os.getenv("API_PORT", 8000)))
@@ -0,0 +1,247 @@
+import sys
+import pathlib
+sys.path.append(str(pathlib.Path(__file__).resolve().parent.parent))
+
+import argparse
+import hashlib
+import json
+import os
+import platform
+import random
+import re
+import shutil
+import tempfile
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Callable, List, Optional, Tuple
+
+import numpy as np
+
+from backend.config import (CHUNK_SIZE, CHUNK_OVERLAP, CHUNK_TOKENS, CHUNK_OVERLAP_TOKENS, DOCS_DIR,
+                            EMBEDDING_MODEL, EVAL_QA, RETRIEVAL_MODE, TOP_K)
+
+COMPONENTS = ["fan belt", "bearing", "damper actuator", "chilled-water valve", "compressor", "condenser coil",
+              "air filter", "VFD", "expansion valve", "supply air sensor", "refrigerant circuit", "cooling tower fan"]
+SYMPTOMS = ["high vibration", "overheating", "low airflow", "short cycling", "excess power draw",
+            "noisy operation", "pressure drop", "sensor drift"]
+ACTIONS = ["tighten the mounting bolts", "re-lubricate per schedule", "recalibrate the sensor",
+           "replace the worn part", "clean the coil surface", "check the control wiring",
+           "verify the setpoint", "inspect for refrigerant leaks"]
+
+
+# ---- Embedders ----
+def hashing_embedder(dim: int = 256) -> Tuple[Callable[[List[str]], List[List[float]]], str]:
+    """Deterministic bag-of-words embedder for offline runs; same text, same vector in every process."""
+    def _embed(texts: List[str]):
+        out = np.zeros((len(texts), dim), dtype=np.float32)
+        for i, t in enumerate(texts):
+            for w in re.findall(r"\w+", t.lower()):
+                h = int.from_bytes(hashlib.blake2b(w.encode("utf-8"), digest_size=8).digest(), "little")
+                out[i, h % dim] += 1.0 if (h >> 63) & 1 else -1.0
+        out /= np.maximum(np.linalg.norm(out, axis=1, keepdims=True), 1e-9)
+        return out.tolist()
+
+    return _embed, f"stub-hash-{dim}"
+
+
+def make_embedder(kind: str):
+    if kind == "stub":
+        return hashing_embedder()
+    if kind == "local":
+        from chromadb.utils import embedding_functions
+        return embedding_functions.SentenceTransformerEmbeddingFunction(model_name=EMBEDDING_MODEL), EMBEDDING_MODEL
+    from backend.retriever import get_embedder
+    return get_embedder()
+
+
+# ---- Corpus and queries ----
+def load_eval(path=EVAL_QA) -> List[dict]:
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def synth_corpus(out_dir: Path, n_docs: int, seed: int = 0, src_dir: Path = DOCS_DIR) -> List[dict]:
+    """Copies the real docs into `out_dir` and adds `n_docs` synthetic fault logs.
+
+    Every synthetic log has its own fault code, so each one comes with a query
+    whose only correct answer is that file.
+    """
+    out_dir.mkdir(parents=True, exist_ok=True)
+    for p in Path(src_dir).glob("*.txt"):
+        shutil.copy(p, out_dir / p.name)
+    rng = random.Random(seed)
+    queries = []
+    for i in range(n_docs):
+        kind = "hvac" if i % 2 == 0 else "chiller"
+        device = f"{'AHU' if kind == 'hvac' else 'CH'}-{rng.randint(1, 40)}"
+        code = f"F{10000 + i}"
+        component, symptom = rng.choice(COMPONENTS), rng.choice(SYMPTOMS)
+        name = f"{kind}_fault_log_{i:05d}.txt"
+        paras = [f"Fault {code} Service Note", f"Device {device} reported {symptom} at the {component}. "
+                 f"Fault code {code} is raised by the controller when the condition persists for ten minutes."]
+        for _ in range(rng.randint(2, 5)):
+            paras.append(" ".join(f"{rng.choice(ACTIONS).capitalize()} on the {rng.choice(COMPONENTS)}."
+                                  for _ in range(rng.randint(2, 6))))
+        (out_dir / name).write_text("\n\n".join(paras) + "\n", encoding="utf-8")
+        queries.append({"question": f"What should I check for fault {code} ({symptom}) on {device}?",
+                        "answer_source": name, "equipment": kind})
+    return queries
+
+
+# ---- Measurements ----
+def peak_rss_mb() -> Optional[float]:
+    try:
+        import resource
+    except ImportError:
+        return None
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss / (1024 * 1024) if sys.platform == "darwin" else rss / 1024
+
+
+def percentiles(values_ms: List[float]) -> dict:
+    a = np.asarray(values_ms, dtype=float)
+    if not len(a):
+        return {}
+    return {"mean_ms": float(a.mean()), "p50_ms": float(np.percentile(a, 50)),
+            "p95_ms": float(np.percentile(a, 95)), "p99_ms": float(np.percentile(a, 99))}
+
+
+def score(hits: List[dict], answer_source: str) -> Tuple[bool, float]:
+    for rank, h in enumerate(hits, start=1):
+        if (h.get("metadata") or {}).get("source") == answer_source:
+            return True, 1.0 / rank
+    return False, 0.0
+
+
+def run_queries(qa: List[dict], service, mode: str, k: int, use_filter: bool, repeat: int = 1) -> dict:
+    from backend.retriever import retrieve, retrieve_many
+    filters = [q.get("equipment") if use_filter else None for q in qa]
+    retrieve(qa[0]["question"], filters[0], k, service, mode)  # warm-up
+    latencies, hits, rr = [], 0, 0.0
+    for _ in range(repeat):
+        for q, f in zip(qa, filters):
+            t0 = time.perf_counter()
+            res = retrieve(q["question"], f, k, service, mode)
+            latencies.append((time.perf_counter() - t0) * 1000)
+            hit, r = score(res, q["answer_source"])
+            hits += hit
+            rr += r
+    n = len(qa) * repeat
+    t0 = time.perf_counter()
+    retrieve_many([q["question"] for q in qa], filters, k, service, mode)
+    batch_s = time.perf_counter() - t0
+    return {"queries": len(qa), f"hit@{k}": hits / n, "mrr": rr / n, "latency": percentiles(latencies),
+            "batch_qps": len(qa) / batch_s if batch_s > 0 else None}
+
+
+def run(embedder: str = "stub", scale: int = 0, n_queries: int = 200, k: int = TOP_K, modes=None,
+        use_filter: bool = True, repeat: int = 3, seed: int = 0, workdir: Optional[str] = None,
+        keep: bool = False) -> dict:
+    """Builds a throwaway index and measures ingest and retrieval; returns a JSON-ready dict."""
+    from backend.retriever import RetrievalService, build_index
+
+    modes = modes or ["dense", "hybrid", "lexical"]
+    root = Path(workdir or tempfile.mkdtemp(prefix="rag-bench-"))
+    docs_dir, chroma_dir = root / "docs", root / "chroma"
+    try:
+        synth = synth_corpus(docs_dir, scale, seed)
+        service = RetrievalService(str(chroma_dir), "bench", embedder=make_embedder(embedder))
+
+        rss0 = peak_rss_mb()
+        t0 = time.perf_counter()
+        build_index(clear=True, service=service, docs_dir=docs_dir, progress=False)
+        ingest_s = time.perf_counter() - t0
+        n_chunks = service.collection.count()
+        n_bytes = sum(p.stat().st_size for p in docs_dir.glob("*.txt"))
+
+        eval_qa = load_eval()
+        rng = random.Random(seed)
+        synth_qa = rng.sample(synth, min(n_queries, len(synth)))
+        results = {}
+        for mode in modes:
+            results[mode] = {"eval": run_queries(eval_qa, service, mode, k, use_filter, repeat)}
+            if synth_qa:
+                results[mode]["synthetic"] = run_queries(synth_qa, service, mode, k, use_filter, 1)
+        return {
+            "timestamp": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+            "config": {"embedder": service.embed_name, "chunk_size": CHUNK_SIZE, "chunk_overlap": CHUNK_OVERLAP,
+                       "chunk_tokens": CHUNK_TOKENS, "chunk_overlap_tokens": CHUNK_OVERLAP_TOKENS, "top_k": k,
+                       "retrieval_mode": RETRIEVAL_MODE, "scale": scale, "filter": use_filter, "seed": seed},
+            "env": {"python": platform.python_version(), "platform": platform.platform(), "cpus": os.cpu_count()},
+            "ingest": {"docs": len(list(docs_dir.glob("*.txt"))), "bytes": n_bytes, "chunks": n_chunks,
+                       "seconds": ingest_s, "chunks_per_s": n_chunks / ingest_s if ingest_s > 0 else None,
+                       "mb_per_s": n_bytes / 1e6 / ingest_s if ingest_s > 0 else None,
+                       "peak_rss_mb_before": rss0, "peak_rss_mb": peak_rss_mb()},
+            "retrieval": results,
+        }
+    finally:
+        if not keep and workdir is None:
+            shutil.rmtree(root, ignore_errors=True)
+
+
+def _flatten(d: dict, prefix: str = "") -> dict:
+    out = {}
+    for key, v in d.items():
+        name = f"{prefix}{key}"
+        if isinstance(v, dict):
+            out.update(_flatten(v, name + "."))
+        elif isinstance(v, (int, float)) and not isinstance(v, bool):
+            out[name] = v
+    return out
+
+
+def compare(current: dict, baseline: dict) -> List[str]:
+    """One line per numeric metric present in both runs, with the relative change."""
+    cur, base = _flatten(current), _flatten(baseline)
+    lines = []
+    for name in sorted(cur.keys() & base.keys()):
+        if not (name.startswith("ingest.") or name.startswith("retrieval.")):
+            continue
+        a, b = cur[name], base[name]
+        change = f"{(a - b) / b * 100:+.1f}%" if b else "n/a"
+        lines.append(f"{name:60s} {b:12.4g} -> {a:12.4g}  {change}")
+    return lines
+
+
+def _report(result: dict) -> str:
+    ing = result["ingest"]
+    lines = [f"embedder={result['config']['embedder']} chunk_tokens={result['config']['chunk_tokens']} "
+             f"k={result['config']['top_k']} scale={result['config']['scale']}",
+             f"ingest: {ing['docs']} docs, {ing['chunks']} chunks in {ing['seconds']:.2f}s "
+             f"({ing['chunks_per_s']:.0f} chunks/s), peak RSS {ing['peak_rss_mb']} MB"]
+    for mode, sets in result["retrieval"].items():
+        for name, r in sets.items():
+            hit = next(v for key, v in r.items() if key.startswith("hit@"))
+            lat = r["latency"]
+            lines.append(f"{mode:8s} {name:9s} hit@k={hit:.3f} mrr={r['mrr']:.3f} "
+                         f"p50={lat['p50_ms']:.2f}ms p95={lat['p95_ms']:.2f}ms p99={lat['p99_ms']:.2f}ms "
+                         f"batch={r['batch_qps']:.0f} q/s")
+    return "\n".join(lines)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Retrieval quality and latency benchmark on a throwaway index.")
+    parser.add_argument("--embedder", choices=["stub", "local", "default"], default="stub",
+                        help="stub: deterministic hashing embedder, local: SentenceTransformer, default: get_embedder()")
+    parser.add_argument("--scale", type=int, default=0, help="synthetic fault-log documents added to data/docs")
+    parser.add_argument("--queries", type=int, default=200, help="synthetic queries sampled from the scaled corpus")
+    parser.add_argument("--k", type=int, default=TOP_K)
+    parser.add_argument("--modes", default="dense,hybrid,lexical")
+    parser.add_argument("--no-filter", action="store_true", help="do not pass the equipment filter")
+    parser.add_argument("--repeat", type=int, default=3, help="passes over the eval set for latency")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--out", help="write the results as JSON to this file")
+    parser.add_argument("--baseline", help="earlier results JSON to compare against")
+    parser.add_argument("--keep", action="store_true", help="keep the temporary corpus and index")
+    a = parser.parse_args()
+
+    result = run(a.embedder, a.scale, a.queries, a.k, a.modes.split(","), not a.no_filter, a.repeat, a.seed,
+                 keep=a.keep)
+    print(_report(result))
+    if a.out:
+        Path(a.out).parent.mkdir(parents=True, exist_ok=True)
+        Path(a.out).write_text(json.dumps(result, indent=2), encoding="utf-8")
+        print(f"Saved {a.out}")
+    if a.baseline:
+        print("\n".join(compare(result, json.loads(Path(a.baseline).read_text(encoding="utf-8")))))
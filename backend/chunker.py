@@ -0,0 +1,180 @@
+import io
+import re
+from typing import IO, Iterator, List, NamedTuple, Optional, Union
+
+from backend.config import CHUNK_TOKENS, CHUNK_OVERLAP_TOKENS
+
+TOKEN_RE = re.compile(r"\w+|[^\w\s]")
+SENTENCE_END_RE = re.compile(r"[.!?]+[\"')\]]*(?=\s|$)")
+LIST_ITEM_RE = re.compile(r"\s*(?:[-*•]|\d+[.)])\s+")
+NUMBERED_HEADING_RE = re.compile(r"\s*\d+(?:\.\d+)*\.?\s+\S")
+MAX_CHARS_PER_TOKEN = 8  # hard length cap per token of budget, for text the token count misses (base64, minified)
+
+
+class Chunk(NamedTuple):
+    start: int  # character offsets into the decoded file, end exclusive
+    end: int
+    text: str
+    tokens: int
+
+
+def count_tokens(text: str) -> int:
+    """Approximate BPE token count: words and punctuation marks."""
+    return len(TOKEN_RE.findall(text))
+
+
+def is_heading(line: str) -> bool:
+    s = line.strip()
+    if not s or len(s) > 80 or (LIST_ITEM_RE.match(line) and not NUMBERED_HEADING_RE.match(line)):
+        return False
+    if s.startswith("#") or s.endswith(":"):
+        return True
+    if s.isupper() and any(c.isalpha() for c in s):
+        return True
+    # short title-like line without sentence punctuation
+    return len(s.split()) <= 8 and s[-1] not in ".!?;," and s[0].isupper()
+
+
+def _lines(f: IO[str], block_size: int) -> Iterator[str]:
+    # readline(limit) keeps a file without newlines from being read in one go
+    while True:
+        line = f.readline(block_size)
+        if not line:
+            return
+        yield line
+
+
+def _units(f: IO[str], block_size: int) -> Iterator[tuple]:
+    """Yields (kind, start, text) with kind "heading", "break" or "text".
+
+    Text units are sentences or list items; a sentence wrapped over several
+    lines is one unit. Units are contiguous, so joining their texts gives the
+    original characters back.
+    """
+    pos = 0
+    carry_start, carry = pos, []
+    for line in _lines(f, block_size):
+        start, pos = pos, pos + len(line)
+        blank = not line.strip()
+        heading = not blank and is_heading(line)
+        item = LIST_ITEM_RE.match(line)
+        if blank or heading or item:
+            if carry:
+                yield "text", carry_start, "".join(carry)
+                carry = []
+            if blank:
+                yield "break", start, line
+                carry_start = pos
+                continue
+            if heading:
+                yield "heading", start, line
+                carry_start = pos
+                continue
+        i = 0
+        if not carry:
+            carry_start = start
+        for m in SENTENCE_END_RE.finditer(line):
+            end = m.end()
+            while end < len(line) and line[end] in " \t":
+                end += 1
+            carry.append(line[i:end])
+            yield "text", carry_start, "".join(carry)
+            carry, carry_start, i = [], start + end, end
+        if i < len(line):
+            carry.append(line[i:])
+        if item and carry:
+            # list items end at the line break even without a full stop
+            yield "text", carry_start, "".join(carry)
+            carry, carry_start = [], pos
+    if carry:
+        yield "text", carry_start, "".join(carry)
+
+
+def _split_long(start: int, text: str, max_tokens: int, max_chars: int) -> Iterator[tuple]:
+    """Splits one oversized unit at whitespace into pieces of at most `max_tokens` and `max_chars`.
+
+    A run without whitespace longer than `max_chars` is cut every `max_chars` characters.
+    """
+    piece_start, n = 0, 0
+    for m in re.finditer(r"\S+\s*", text):
+        for cut in range(m.start(), m.end(), max_chars):
+            end = min(m.end(), cut + max_chars)
+            t = count_tokens(text[cut:end])
+            if cut > piece_start and (n + t > max_tokens or end - piece_start > max_chars):
+                yield start + piece_start, text[piece_start:cut], n
+                piece_start, n = cut, 0
+            n += t
+    yield start + piece_start, text[piece_start:], n
+
+
+def iter_chunks(source: Union[str, IO[str]], max_tokens: int = CHUNK_TOKENS,
+                overlap_tokens: int = CHUNK_OVERLAP_TOKENS, block_size: int = 1 << 16,
+                max_chars: Optional[int] = None) -> Iterator[Chunk]:
+    """Streams chunks of at most `max_tokens` from a path or text file object.
+
+    Chunks end on sentence, list item or paragraph boundaries. A heading
+    starts a new chunk once the current one is at least half full; when a
+    chunk fills up inside a section its last sentences (up to
+    `overlap_tokens`) start the next one. Only the units of the chunk being
+    built are held in memory, so memory does not grow with the file.
+
+    Chunks are also kept under `max_chars` (default `max_tokens *
+    MAX_CHARS_PER_TOKEN`) characters, so a long run without spaces, which
+    counts as one token, is still cut to a size the embedder accepts.
+    """
+    if isinstance(source, str):
+        with open(source, "r", encoding="utf-8", errors="ignore", newline="") as f:
+            yield from iter_chunks(f, max_tokens, overlap_tokens, block_size, max_chars)
+        return
+    max_chars = max_chars or max_tokens * MAX_CHARS_PER_TOKEN
+
+    window: List[tuple] = []  # (start, text, tokens)
+    size = chars = 0
+
+    def emit():
+        text = "".join(u[1] for u in window)
+        stripped = text.strip()
+        if not stripped:
+            return None
+        start = window[0][0] + (len(text) - len(text.lstrip()))
+        return Chunk(start, start + len(stripped), stripped, sum(u[2] for u in window))
+
+    for kind, start, text in _units(source, block_size):
+        if kind == "break":
+            if window:
+                window.append((start, text, 0))
+                chars += len(text)
+            continue
+        if kind == "heading" and size >= max_tokens // 2:
+            chunk = emit()
+            if chunk:
+                yield chunk
+            window, size, chars = [], 0, 0
+        n = count_tokens(text)
+        long = n > max_tokens or len(text) > max_chars
+        for piece in (_split_long(start, text, max_tokens, max_chars) if long else [(start, text, n)]):
+            if window and (size + piece[2] > max_tokens or chars + len(piece[1]) > max_chars):
+                chunk = emit()
+                if chunk:
+                    yield chunk
+                keep, kept = [], 0
+                # overlap with the previous sentences, never across a paragraph break
+                for u in reversed(window):
+                    if not u[2] or kept + u[2] > overlap_tokens or kept + u[2] + piece[2] > max_tokens:
+                        break
+                    keep.insert(0, u)
+                    kept += u[2]
+                window, size = keep, kept
+                chars = sum(len(u[1]) for u in window)
+                if chars + len(piece[1]) > max_chars:
+                    window, size, chars = [], 0, 0
+            window.append(piece)
+            size += piece[2]
+            chars += len(piece[1])
+    chunk = emit()
+    if chunk:
+        yield chunk
+
+
+def chunk_text(text: str, max_tokens: int = CHUNK_TOKENS, overlap_tokens: int = CHUNK_OVERLAP_TOKENS) -> List[str]:
+    return [c.text for c in iter_chunks(io.StringIO(text, newline=""), max_tokens, overlap_tokens)] or [text]
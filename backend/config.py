@@ -8,10 +8,39 @@ load_dotenv(ROOT / ".env" if (ROOT / ".env").exists() else None)
 CHROMA_DIR = os.getenv("CHROMA_DIR", str(ROOT / ".chroma"))
 EMBEDDING_MODEL = os.getenv("EMBEDDING_MODEL", "sentence-transformers/all-MiniLM-L6-v2")
 OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
+OPENAI_BASE_URL = os.getenv("OPENAI_BASE_URL") or None
+LLM_MODEL = os.getenv("LLM_MODEL", "gpt-4o-mini")
 DOCS_DIR = ROOT / "data" / "docs"
 EVAL_QA = ROOT / "data" / "eval" / "qa_eval.json"
 SENSOR_CSV = ROOT / "data" / "sensor_stream.csv"
+SENSOR_STORE = Path(os.getenv("SENSOR_STORE", str(ROOT / "data" / "sensor_store")))
+SENSOR_BACKEND = os.getenv("SENSOR_BACKEND", "csv")
+STORE_COMPACT_FILES = int(os.getenv("STORE_COMPACT_FILES", 16))  # part files per partition before a merge
+MODEL_DIR = os.getenv("MODEL_DIR", str(ROOT / ".models"))
+EMBED_CACHE_PATH = os.getenv("EMBED_CACHE_PATH", str(ROOT / ".cache" / "embeddings.sqlite3"))
 
 CHUNK_SIZE = int(os.getenv("CHUNK_SIZE", 800))
 CHUNK_OVERLAP = int(os.getenv("CHUNK_OVERLAP", 120))
-TOP_K = int(os.getenv("TOP_K", 4))
\ No newline at end of file
+CHUNK_TOKENS = int(os.getenv("CHUNK_TOKENS", CHUNK_SIZE // 4))
+CHUNK_OVERLAP_TOKENS = int(os.getenv("CHUNK_OVERLAP_TOKENS", CHUNK_OVERLAP // 4))
+TOP_K = int(os.getenv("TOP_K", 4))
+EMBED_BATCH_SIZE = int(os.getenv("EMBED_BATCH_SIZE", 64))
+EMBED_WORKERS = int(os.getenv("EMBED_WORKERS", min(4, os.cpu_count() or 1)))
+EMBED_CACHE = os.getenv("EMBED_CACHE", "1") == "1"
+EMBED_CACHE_MAX_ENTRIES = int(os.getenv("EMBED_CACHE_MAX_ENTRIES", 200_000))
+RETRIEVAL_MODE = os.getenv("RETRIEVAL_MODE", "hybrid")  # hybrid | dense | lexical
+RRF_K = int(os.getenv("RRF_K", 60))
+LEXICAL_EXACT = os.getenv("LEXICAL_EXACT", "1") == "1"
+VECTOR_BACKEND = os.getenv("VECTOR_BACKEND", "chroma")  # chroma | int8 | pq
+PQ_SUBVECTORS = int(os.getenv("PQ_SUBVECTORS", 0))  # 0: one per 8 dimensions
+RERANK_FACTOR = int(os.getenv("RERANK_FACTOR", 32))
+
+MODEL_MAX_AGE_S = float(os.getenv("MODEL_MAX_AGE_S", 6 * 3600))
+DRIFT_Z = float(os.getenv("DRIFT_Z", 1.0))
+LLM_CACHE_SIZE = int(os.getenv("LLM_CACHE_SIZE", 512))
+LLM_CACHE_SIM = float(os.getenv("LLM_CACHE_SIM", 0))  # opt-in, e.g. 0.95; 0 keeps exact-match caching only
+LLM_CONCURRENCY = int(os.getenv("LLM_CONCURRENCY", 4))
+LLM_RATE_PER_SEC = float(os.getenv("LLM_RATE_PER_SEC", 2.0))
+API_WORKERS = int(os.getenv("API_WORKERS", min(4, os.cpu_count() or 1)))
+SHARD_WORKERS = int(os.getenv("SHARD_WORKERS", os.cpu_count() or 1))
+TRACING = os.getenv("TRACING", "1") == "1"
\ No newline at end of file
@@ -1,37 +1,151 @@
+import sys
+import pathlib
+sys.path.append(str(pathlib.Path(__file__).resolve().parent.parent))
+
 import argparse, random, csv, time, os
 from datetime import datetime, timedelta
 
+import numpy as np
+import pandas as pd
+
+FIELDNAMES = ["timestamp","device_id","temp_c","vibration","power_kw","occupancy"]
+TS_FORMAT = "%Y-%m-%dT%H:%M:%S.%f"
+
 def simulate(rows: int, out: str, sleep: float = 0.0):
     # Create folder if it doesn't exist
-    os.makedirs(os.path.dirname(out), exist_ok=True)
+    os.makedirs(os.path.dirname(out) or ".", exist_ok=True)
 
-    fieldnames = ["timestamp","device_id","temp_c","vibration","power_kw","occupancy"]
+    start = datetime.utcnow()
     with open(out, "w", newline="") as f:
-        w = csv.DictWriter(f, fieldnames=fieldnames)
+        w = csv.DictWriter(f, fieldnames=FIELDNAMES)
         w.writeheader()
-
-    start = datetime.utcnow()
-    for i in range(rows):
-        ts = start + timedelta(seconds=i)
-        record = {
-            "timestamp": ts.isoformat(),
-            "device_id": f"AHU-{1 + (i % 3)}",
-            "temp_c": round(22 + random.gauss(0, 0.8) + 0.01*i/rows*5, 2),
-            "vibration": round(0.2 + 0.005*(i/rows) + abs(random.gauss(0, 0.02)), 3),
-            "power_kw": round(15 + random.gauss(0, 1.5) + 0.005*(i/rows)*10, 2),
-            "occupancy": int(max(0, 50 + 30*random.random())),
-        }
-        with open(out, "a", newline="") as f:
-            w = csv.DictWriter(f, fieldnames=fieldnames)
+        for i in range(rows):
+            ts = start + timedelta(seconds=i)
+            record = {
+                "timestamp": ts.isoformat(),
+                "device_id": f"AHU-{1 + (i % 3)}",
+                "temp_c": round(22 + random.gauss(0, 0.8) + 0.01*i/rows*5, 2),
+                "vibration": round(0.2 + 0.005*(i/rows) + abs(random.gauss(0, 0.02)), 3),
+                "power_kw": round(15 + random.gauss(0, 1.5) + 0.005*(i/rows)*10, 2),
+                "occupancy": int(max(0, 50 + 30*random.random())),
+            }
             w.writerow(record)
-        if sleep:
-            time.sleep(sleep)
+            if sleep:
+                # keep the file tail-able while streaming slowly
+                f.flush()
+                time.sleep(sleep)
+
+
+# ---- Batch generator ----
+def iter_batches(devices: int, seconds: int, block_seconds: int = 3600,
+                 start: datetime = None, prefix: str = "AHU", seed: int = None,
+                 iso_timestamps: bool = False):
+    """Yields DataFrames of 1 Hz readings for all devices, `block_seconds` at a time."""
+    rng = np.random.default_rng(seed)
+    start = np.datetime64(start or datetime.utcnow(), "us")
+    device_ids = np.array([f"{prefix}-{d + 1}" for d in range(devices)], dtype=object)
+    # per-device operating point so devices don't all look identical
+    temp_base = 22 + rng.normal(0, 0.5, devices)
+    power_base = 15 + rng.normal(0, 2.0, devices)
+    block_seconds = max(1, min(block_seconds, seconds))
+
+    for t0 in range(0, seconds, block_seconds):
+        n_t = min(block_seconds, seconds - t0)
+        n = n_t * devices
+        t = np.repeat(np.arange(t0, t0 + n_t), devices)
+        frac = t / seconds
+        dev = np.tile(np.arange(devices), n_t)
+        ts = start + np.arange(t0, t0 + n_t).astype("timedelta64[s]")
+        if iso_timestamps:
+            # format each second once instead of once per device
+            ts = pd.DatetimeIndex(ts).strftime(TS_FORMAT).values
+        yield pd.DataFrame({
+            "timestamp": np.repeat(ts, devices),
+            "device_id": device_ids[dev],
+            "temp_c": np.round(temp_base[dev] + rng.normal(0, 0.8, n) + 0.05*frac, 2),
+            "vibration": np.round(0.2 + 0.005*frac + np.abs(rng.normal(0, 0.02, n)), 3),
+            "power_kw": np.round(power_base[dev] + rng.normal(0, 1.5, n) + 0.05*frac, 2),
+            "occupancy": (50 + 30*rng.random(n)).astype(np.int64),
+        }, columns=FIELDNAMES)
+
+
+def simulate_batch(devices: int, seconds: int, out: str, fmt: str = "csv",
+                   block_seconds: int = 3600, seed: int = None) -> int:
+    """Writes `devices` x `seconds` rows in bulk; memory is bounded by one block."""
+    os.makedirs(os.path.dirname(out) or ".", exist_ok=True)
+    # keep a block around a million rows regardless of fleet size
+    block_seconds = max(1, min(block_seconds, 1_000_000 // max(devices, 1)))
+    total = 0
+    if fmt == "csv":
+        try:
+            import pyarrow as pa
+            import pyarrow.csv as pcsv
+        except ImportError:
+            pa = None
+        else:
+            opts = pcsv.WriteOptions(include_header=False, quoting_style="none")
+        with open(out, "wb") as f:
+            f.write((",".join(FIELDNAMES) + "\n").encode())
+            for df in iter_batches(devices, seconds, block_seconds, seed=seed, iso_timestamps=True):
+                if pa is not None:
+                    pcsv.write_csv(pa.Table.from_pandas(df, preserve_index=False), f, opts)
+                else:
+                    f.write(df.to_csv(header=False, index=False).encode())
+                total += len(df)
+    elif fmt == "parquet":
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+        writer = None
+        try:
+            for df in iter_batches(devices, seconds, block_seconds, seed=seed):
+                table = pa.Table.from_pandas(df, preserve_index=False)
+                if writer is None:
+                    writer = pq.ParquetWriter(out, table.schema, compression="zstd")
+                writer.write_table(table)
+                total += len(df)
+        finally:
+            if writer is not None:
+                writer.close()
+    elif fmt == "store":
+        # `out` is the root directory of a partitioned TimeSeriesStore
+        from backend.tsstore import TimeSeriesStore
+        store = TimeSeriesStore(out)
+        for df in iter_batches(devices, seconds, block_seconds, seed=seed):
+            total += store.write(df)
+    elif fmt == "arrow":
+        import pyarrow as pa
+        writer = None
+        try:
+            for df in iter_batches(devices, seconds, block_seconds, seed=seed):
+                table = pa.Table.from_pandas(df, preserve_index=False)
+                if writer is None:
+                    writer = pa.ipc.new_file(out, table.schema)
+                writer.write_table(table)
+                total += len(df)
+        finally:
+            if writer is not None:
+                writer.close()
+    else:
+        raise ValueError(f"Unknown format: {fmt}")
+    return total
 
 if __name__ == "__main__":
     p = argparse.ArgumentParser()
     p.add_argument("--rows", type=int, default=1000)
     p.add_argument("--out", type=str, default="data/sensor_stream.csv")
     p.add_argument("--sleep", type=float, default=0.0)
+    p.add_argument("--devices", type=int, default=None, help="batch mode: number of devices at 1 Hz")
+    p.add_argument("--seconds", type=int, default=None, help="batch mode: duration in seconds")
+    p.add_argument("--format", type=str, default="csv", choices=["csv", "parquet", "arrow", "store"])
+    p.add_argument("--block-seconds", type=int, default=3600)
+    p.add_argument("--seed", type=int, default=None)
     a = p.parse_args()
-    simulate(a.rows, a.out, a.sleep)
-    print(f"Wrote {a.rows} rows to {a.out}")
\ No newline at end of file
+    if a.devices or a.seconds or a.format != "csv":
+        devices = a.devices or 3
+        seconds = a.seconds or max(1, a.rows // devices)
+        t0 = time.perf_counter()
+        n = simulate_batch(devices, seconds, a.out, a.format, a.block_seconds, a.seed)
+        print(f"Wrote {n} rows ({devices} devices x {seconds}s) to {a.out} in {time.perf_counter() - t0:.1f}s")
+    else:
+        simulate(a.rows, a.out, a.sleep)
+        print(f"Wrote {a.rows} rows to {a.out}")
@@ -0,0 +1,121 @@
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+from typing import Callable, Dict, List, Optional, Sequence
+
+import numpy as np
+
+from backend.config import EMBED_CACHE_PATH, EMBED_CACHE_MAX_ENTRIES
+
+
+class EmbeddingCache:
+    """On-disk float32 embedding cache keyed by (model, sha256(text)).
+
+    Backed by SQLite so it can be shared by the dashboard, ingestion and the
+    API process. Least-recently-used rows are evicted once the cache holds more
+    than `max_entries` vectors.
+    """
+
+    def __init__(self, path: str = EMBED_CACHE_PATH, max_entries: int = EMBED_CACHE_MAX_ENTRIES):
+        self.path = str(path)
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        self._conn = sqlite3.connect(self.path, check_same_thread=False, timeout=30)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS embeddings ("
+            " model TEXT NOT NULL, key TEXT NOT NULL, dim INTEGER NOT NULL, vec BLOB NOT NULL,"
+            " used REAL NOT NULL, PRIMARY KEY (model, key))"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS embeddings_used ON embeddings (used)")
+        self._conn.commit()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def key(text: str) -> str:
+        return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+    def get_many(self, model: str, texts: Sequence[str]) -> Dict[str, np.ndarray]:
+        keys = list({self.key(t) for t in texts})
+        found: Dict[str, np.ndarray] = {}
+        now = time.time()
+        with self._lock:
+            for i in range(0, len(keys), 500):
+                part = keys[i:i + 500]
+                rows = self._conn.execute(
+                    f"SELECT key, vec FROM embeddings WHERE model = ? AND key IN ({','.join('?' * len(part))})",
+                    [model, *part],
+                ).fetchall()
+                for k, vec in rows:
+                    found[k] = np.frombuffer(vec, dtype=np.float32)
+            if found:
+                self._conn.executemany("UPDATE embeddings SET used = ? WHERE model = ? AND key = ?",
+                                       [(now, model, k) for k in found])
+                self._conn.commit()
+        return found
+
+    def put_many(self, model: str, texts: Sequence[str], vectors):
+        now = time.time()
+        rows = []
+        for t, v in zip(texts, vectors):
+            v = np.asarray(v, dtype=np.float32)
+            rows.append((model, self.key(t), v.shape[0], v.tobytes(), now))
+        with self._lock:
+            self._conn.executemany("INSERT OR REPLACE INTO embeddings VALUES (?, ?, ?, ?, ?)", rows)
+            self._evict()
+            self._conn.commit()
+
+    def _evict(self):
+        n = self._conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+        if n > self.max_entries:
+            self._conn.execute(
+                "DELETE FROM embeddings WHERE rowid IN "
+                "(SELECT rowid FROM embeddings ORDER BY used LIMIT ?)", (n - self.max_entries,))
+
+    def __len__(self):
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+
+
+class CachedEmbedder:
+    """Wraps an embedding callable so only texts missing from the cache are embedded."""
+
+    def __init__(self, embed_fn: Callable[[List[str]], list], model: str, cache: EmbeddingCache):
+        self.embed_fn = embed_fn
+        self.model = model
+        self.cache = cache
+
+    def __call__(self, texts: List[str]) -> np.ndarray:
+        texts = list(texts)
+        found = self.cache.get_many(self.model, texts)
+        keys = [EmbeddingCache.key(t) for t in texts]
+        missing, seen = [], set()
+        for t, k in zip(texts, keys):
+            if k not in found and k not in seen:
+                missing.append(t)
+                seen.add(k)
+        self.cache.hits += len(texts) - len(missing)
+        self.cache.misses += len(missing)
+        if missing:
+            vecs = np.asarray(self.embed_fn(missing), dtype=np.float32)
+            self.cache.put_many(self.model, missing, vecs)
+            for t, v in zip(missing, vecs):
+                found[EmbeddingCache.key(t)] = v
+        return np.stack([found[k] for k in keys]) if keys else np.zeros((0, 0), dtype=np.float32)
+
+
+_cache: Optional[EmbeddingCache] = None
+_cache_lock = threading.Lock()
+
+
+def get_embedding_cache() -> EmbeddingCache:
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = EmbeddingCache()
+        return _cache
@@ -1,6 +1,10 @@
 import sys
 import pathlib
+import argparse
 sys.path.append(str(pathlib.Path(__file__).resolve().parent.parent))
 from backend.retriever import build_index
 if __name__ == '__main__':
-    build_index(clear=True)
\ No newline at end of file
+    p = argparse.ArgumentParser()
+    p.add_argument("--clear", action="store_true", help="drop the collection and re-embed everything")
+    a = p.parse_args()
+    build_index(clear=a.clear)
\ No newline at end of file
@@ -0,0 +1,175 @@
+import math
+import os
+import re
+from collections import Counter
+from pathlib import Path
+from typing import Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+TOKEN_RE = re.compile(r"[a-z0-9]+(?:[-_./][a-z0-9]+)*")
+SPLIT_RE = re.compile(r"[-_./]")
+STOPWORDS = frozenset(
+    "a an and are as at be by can do does for from how i if in is it its of on or should the this to "
+    "what when which with".split()
+)
+
+
+def tokenize(text: str) -> List[str]:
+    """Lowercase word tokens; compound tokens like `ahu-2` or `e-104` are kept whole and also split."""
+    out = []
+    for t in TOKEN_RE.findall(text.lower()):
+        if t in STOPWORDS:
+            continue
+        out.append(t)
+        if not t.isalnum():
+            out.extend(p for p in SPLIT_RE.split(t) if p and p not in STOPWORDS)
+    return out
+
+
+def identifier_tokens(query: str) -> List[str]:
+    """Tokens that look like device IDs, fault codes or part numbers (letters and digits, e.g. ahu-2, f-102).
+
+    Plain numbers such as "30" or "6" are not identifiers.
+    """
+    return sorted({t for t in TOKEN_RE.findall(query.lower())
+                   if any(c.isdigit() for c in t) and any(c.isalpha() for c in t)})
+
+
+class LexicalIndex:
+    """In-memory BM25 index over chunk texts, stored as flat NumPy postings.
+
+    Postings of term `t` are `docs[offsets[t]:offsets[t + 1]]` with the BM25
+    impact of the term in each document precomputed in `weights`, so a query
+    is a few array slices and one `np.bincount`. Texts are not kept; hits
+    are chunk IDs.
+    """
+
+    def __init__(self, ids: np.ndarray, equipment: np.ndarray, equipment_names: np.ndarray,
+                 vocab: np.ndarray, offsets: np.ndarray, docs: np.ndarray, weights: np.ndarray):
+        self.ids = ids
+        self.equipment = equipment
+        self.equipment_names = equipment_names
+        self.vocab = vocab
+        self.offsets = offsets
+        self.docs = docs
+        self.weights = weights
+        self._ids = ids.tolist()
+        self._terms = {t: i for i, t in enumerate(vocab.tolist())}
+        self._equip_codes = {e: i for i, e in enumerate(equipment_names.tolist())}
+
+    def __len__(self):
+        return len(self.ids)
+
+    @classmethod
+    def build(cls, ids: Sequence[str], texts: Iterable[str], metadatas: Sequence[dict],
+              k1: float = 1.2, b: float = 0.75) -> "LexicalIndex":
+        equipment_names = sorted({(m or {}).get("equipment") or "" for m in metadatas})
+        codes = {e: i for i, e in enumerate(equipment_names)}
+        equipment = np.array([codes[(m or {}).get("equipment") or ""] for m in metadatas], dtype=np.int16)
+
+        postings = {}
+        lengths = np.zeros(len(ids), dtype=np.float32)
+        for d, text in enumerate(texts):
+            tf = Counter(tokenize(text or ""))
+            lengths[d] = sum(tf.values())
+            for term, n in tf.items():
+                postings.setdefault(term, []).append((d, n))
+
+        n_docs = len(ids)
+        avgdl = float(lengths.mean()) if n_docs and lengths.any() else 1.0
+        vocab = sorted(postings)
+        offsets = np.zeros(len(vocab) + 1, dtype=np.int64)
+        docs, weights = [], []
+        for i, term in enumerate(vocab):
+            plist = postings[term]
+            d = np.fromiter((p[0] for p in plist), dtype=np.int32, count=len(plist))
+            tf = np.fromiter((p[1] for p in plist), dtype=np.float32, count=len(plist))
+            idf = math.log(1.0 + (n_docs - len(plist) + 0.5) / (len(plist) + 0.5))
+            w = idf * tf * (k1 + 1) / (tf + k1 * (1 - b + b * lengths[d] / avgdl))
+            docs.append(d)
+            weights.append(w.astype(np.float32))
+            offsets[i + 1] = offsets[i] + len(plist)
+        return cls(
+            ids=np.array(list(ids), dtype=str),
+            equipment=equipment,
+            equipment_names=np.array(equipment_names, dtype=str),
+            vocab=np.array(vocab, dtype=str),
+            offsets=offsets,
+            docs=np.concatenate(docs) if docs else np.zeros(0, dtype=np.int32),
+            weights=np.concatenate(weights) if weights else np.zeros(0, dtype=np.float32),
+        )
+
+    def _postings(self, term: str) -> Tuple[np.ndarray, np.ndarray]:
+        t = self._terms.get(term)
+        if t is None:
+            return self.docs[:0], self.weights[:0]
+        lo, hi = self.offsets[t], self.offsets[t + 1]
+        return self.docs[lo:hi], self.weights[lo:hi]
+
+    def search(self, query: str, k: int, equipment: Optional[str] = None,
+               require: Sequence[str] = ()) -> List[Tuple[str, float]]:
+        """Top-`k` (chunk ID, BM25 score) pairs, optionally only documents containing every `require` term."""
+        terms = list(dict.fromkeys(tokenize(query)))
+        parts = [self._postings(t) for t in terms]
+        parts = [p for p in parts if len(p[0])]
+        if not parts or not len(self.ids):
+            return []
+        docs = np.concatenate([p[0] for p in parts])
+        weights = np.concatenate([p[1] for p in parts])
+        if equipment:
+            code = self._equip_codes.get(equipment)
+            if code is None:
+                return []
+            keep = self.equipment[docs] == code
+            docs, weights = docs[keep], weights[keep]
+        scores = np.bincount(docs, weights=weights, minlength=len(self.ids))
+        for term in require:
+            d, _ = self._postings(term)
+            mask = np.zeros(len(scores), dtype=bool)
+            mask[d] = True
+            scores[~mask] = 0.0
+        hits = np.flatnonzero(scores)
+        if len(hits) > k:
+            # keep everything tied with the k-th score so ties break by position, not by argpartition
+            kth = np.partition(scores[hits], len(hits) - k)[len(hits) - k]
+            hits = hits[scores[hits] >= kth]
+        hits = hits[np.argsort(-scores[hits], kind="stable")][:k]
+        return [(self._ids[i], float(scores[i])) for i in hits]
+
+    def exact(self, query: str, k: int, equipment: Optional[str] = None) -> List[Tuple[str, float]]:
+        """Chunks containing every device ID, fault code or part number the query names, by BM25 score.
+
+        Empty when the query names none or no chunk has all of them. The
+        result is one more ranking for rrf_fuse(), not an answer on its own.
+        """
+        require = identifier_tokens(query)
+        if not require:
+            return []
+        return self.search(query, k, equipment, require=require)
+
+    # ---- Persistence ----
+    def save(self, path):
+        path = Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = path.with_name(path.stem + ".tmp.npz")
+        np.savez(tmp, ids=self.ids, equipment=self.equipment, equipment_names=self.equipment_names,
+                 vocab=self.vocab, offsets=self.offsets, docs=self.docs, weights=self.weights)
+        os.replace(tmp, path)
+
+    @classmethod
+    def load(cls, path) -> Optional["LexicalIndex"]:
+        try:
+            with np.load(path, allow_pickle=False) as z:
+                return cls(**{name: z[name] for name in z.files})
+        except (OSError, ValueError, KeyError):
+            return None
+
+
+def rrf_fuse(rankings: List[List[str]], k: int, rrf_k: int = 60) -> List[Tuple[str, float]]:
+    """Reciprocal rank fusion: score(d) = sum over rankings of 1 / (rrf_k + rank)."""
+    scores = {}
+    for ranking in rankings:
+        for rank, doc_id in enumerate(ranking, start=1):
+            scores[doc_id] = scores.get(doc_id, 0.0) + 1.0 / (rrf_k + rank)
+    return sorted(scores.items(), key=lambda kv: -kv[1])[:k]
@@ -2,43 +2,259 @@ import sys
 import pathlib
 sys.path.append(str(pathlib.Path(__file__).resolve().parent.parent))
 
-from typing import List, Optional
-from backend.config import OPENAI_API_KEY
+import hashlib
+import re
+import threading
+import time
+from collections import OrderedDict
+from typing import AsyncIterator, Callable, Iterator, List, Optional
 
-def llm_summarize(question: str, contexts: List[str], max_tokens: int = 256) -> Optional[str]:
-    """Summarizes maintenance actions based on retrieved contexts using OpenAI API."""
+import numpy as np
+
+from backend.config import OPENAI_API_KEY, OPENAI_BASE_URL, LLM_MODEL, LLM_CACHE_SIZE, LLM_CACHE_SIM
+from backend.metrics import inc, metrics, span, traced
+
+SYSTEM_PROMPT = (
+    "You are a helpful maintenance assistant for building equipment. "
+    "Given retrieved document excerpts and a sensor alert, provide concise actionable steps "
+    "and cite the most relevant source names."
+)
+
+_client = None
+_async_client = None
+_client_lock = threading.Lock()
+
+
+def get_client():
+    """Returns a process-wide OpenAI client so its HTTP connection pool is reused."""
+    global _client
+    with _client_lock:
+        if _client is None:
+            from openai import OpenAI
+            _client = OpenAI(api_key=OPENAI_API_KEY, base_url=OPENAI_BASE_URL)
+        return _client
+
+
+def get_async_client():
+    global _async_client
+    with _client_lock:
+        if _async_client is None:
+            from openai import AsyncOpenAI
+            _async_client = AsyncOpenAI(api_key=OPENAI_API_KEY, base_url=OPENAI_BASE_URL)
+        return _async_client
+
+
+# ---- Response cache ----
+def normalize_question(question: str) -> str:
+    return re.sub(r"\s+", " ", question.strip().lower()).strip(" ?.!")
+
+
+class ResponseCache:
+    """LRU of summaries keyed by normalized question + retrieved chunk IDs.
+
+    With `similarity` > 0 (off by default) a miss falls back to the cached
+    question with the same chunk IDs whose embedding has cosine similarity
+    >= `similarity`. Empty answers are never cached.
+    """
+
+    def __init__(self, size: int = LLM_CACHE_SIZE, similarity: float = LLM_CACHE_SIM):
+        self.size = size
+        self.similarity = similarity
+        self._items: "OrderedDict[tuple, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def _embed(question: str) -> Optional[np.ndarray]:
+        try:
+            from backend.retriever import get_service
+            v = np.asarray(get_service().embed([question])[0], dtype=np.float32)
+        except Exception:
+            return None
+        return v / (np.linalg.norm(v) or 1.0)
+
+    def get(self, question: str, context_key: tuple) -> Optional[str]:
+        key = (normalize_question(question), context_key)
+        with self._lock:
+            if key in self._items:
+                self._items.move_to_end(key)
+                self.hits += 1
+                inc("llm_cache_hits")
+                return self._items[key][0]
+            candidates = [(k, v) for k, v in self._items.items() if k[1] == context_key and v[1] is not None]
+        if self.similarity > 0 and candidates:
+            q = self._embed(question)
+            if q is not None:
+                k, (answer, emb) = max(candidates, key=lambda kv: float(kv[1][1] @ q))
+                if float(emb @ q) >= self.similarity:
+                    inc("llm_cache_hits", kind="semantic")
+                    with self._lock:
+                        self.hits += 1
+                        if k in self._items:
+                            self._items.move_to_end(k)
+                    return answer
+        with self._lock:
+            self.misses += 1
+        inc("llm_cache_misses")
+        return None
+
+    def put(self, question: str, context_key: tuple, answer: str):
+        if not answer:
+            return
+        emb = self._embed(question) if self.similarity > 0 else None
+        with self._lock:
+            self._items[(normalize_question(question), context_key)] = (answer, emb)
+            while len(self._items) > self.size:
+                self._items.popitem(last=False)
+
+
+_cache = ResponseCache()
+
+
+def _context_key(contexts: List[str], context_ids: Optional[List[str]], max_tokens: int) -> tuple:
+    ids = context_ids or [hashlib.sha1(c.encode("utf-8")).hexdigest()[:16] for c in contexts]
+    return (LLM_MODEL, max_tokens, *ids[:6])
+
+
+def _messages(question: str, contexts: List[str]) -> list:
+    prompt_parts = [f"Context {i+1}: {c}" for i, c in enumerate(contexts[:6])]
+    prompt = "\n\n".join(prompt_parts)
+    user_prompt = (
+        f"Question/Alert:\n{question}\n\nRetrieved contexts:\n{prompt}\n\n"
+        "Provide 6 concise actionable checks or steps, and mention the source file names for each step."
+    )
+    return [
+        {"role": "system", "content": SYSTEM_PROMPT},
+        {"role": "user", "content": user_prompt}
+    ]
+
+
+@traced()
+def llm_summarize(question: str, contexts: List[str], max_tokens: int = 256,
+                  context_ids: Optional[List[str]] = None,
+                  before_request: Optional[Callable[[], None]] = None) -> Optional[str]:
+    """Summarizes maintenance actions based on retrieved contexts using OpenAI API.
+
+    `before_request` is called only when the answer is not cached, right
+    before the API request (e.g. a rate limiter's acquire).
+    """
     if not OPENAI_API_KEY:
         return None
+    key = _context_key(contexts, context_ids, max_tokens)
+    cached = _cache.get(question, key)
+    if cached is not None:
+        return cached
+    if before_request is not None:
+        before_request()
     try:
-        from openai import OpenAI
-        client = OpenAI(api_key=OPENAI_API_KEY)
-        system = (
-            "You are a helpful maintenance assistant for building equipment. "
-            "Given retrieved document excerpts and a sensor alert, provide concise actionable steps "
-            "and cite the most relevant source names."
-        )
-        prompt_parts = [f"Context {i+1}: {c}" for i, c in enumerate(contexts[:6])]
-        prompt = "\n\n".join(prompt_parts)
-        user_prompt = (
-            f"Question/Alert:\n{question}\n\nRetrieved contexts:\n{prompt}\n\n"
-            "Provide 6 concise actionable checks or steps, and mention the source file names for each step."
+        with span("llm.request"):
+            resp = get_client().chat.completions.create(
+                model=LLM_MODEL,
+                messages=_messages(question, contexts),
+                max_tokens=max_tokens,
+                temperature=0.0,
+            )
+        answer = resp.choices[0].message.content.strip()
+    except Exception as e:
+        inc("llm_errors")
+        return f"(LLM error: {e})"
+    _cache.put(question, key, answer)
+    return answer
+
+
+def llm_summarize_stream(question: str, contexts: List[str], max_tokens: int = 256,
+                         context_ids: Optional[List[str]] = None) -> Iterator[str]:
+    """Like llm_summarize() but yields tokens as they arrive (e.g. for st.write_stream)."""
+    if not OPENAI_API_KEY:
+        return
+    key = _context_key(contexts, context_ids, max_tokens)
+    cached = _cache.get(question, key)
+    if cached is not None:
+        yield cached
+        return
+    parts = []
+    start = time.perf_counter()
+    try:
+        stream = get_client().chat.completions.create(
+            model=LLM_MODEL,
+            messages=_messages(question, contexts),
+            max_tokens=max_tokens,
+            temperature=0.0,
+            stream=True,
         )
-        resp = client.chat.completions.create(
-            model="gpt-4o-mini",
-            messages=[
-                {"role": "system", "content": system},
-                {"role": "user", "content": user_prompt}
-            ],
+        for chunk in stream:
+            delta = chunk.choices[0].delta.content if chunk.choices else None
+            if delta:
+                if not parts:
+                    metrics.observe("llm.first_token", time.perf_counter() - start)
+                parts.append(delta)
+                yield delta
+    except Exception as e:
+        inc("llm_errors")
+        yield f"(LLM error: {e})"
+        return
+    # a generator is timed from the request to the last token, not with @traced
+    metrics.observe("llm_summarize_stream", time.perf_counter() - start)
+    _cache.put(question, key, "".join(parts).strip())
+
+
+async def allm_summarize(question: str, contexts: List[str], max_tokens: int = 256,
+                         context_ids: Optional[List[str]] = None) -> Optional[str]:
+    """Async llm_summarize() on the pooled AsyncOpenAI client."""
+    if not OPENAI_API_KEY:
+        return None
+    key = _context_key(contexts, context_ids, max_tokens)
+    cached = _cache.get(question, key)
+    if cached is not None:
+        return cached
+    try:
+        resp = await get_async_client().chat.completions.create(
+            model=LLM_MODEL,
+            messages=_messages(question, contexts),
             max_tokens=max_tokens,
             temperature=0.0,
         )
-        return resp.choices[0].message.content.strip()
+        answer = resp.choices[0].message.content.strip()
     except Exception as e:
         return f"(LLM error: {e})"
+    _cache.put(question, key, answer)
+    return answer
+
+
+async def allm_summarize_stream(question: str, contexts: List[str], max_tokens: int = 256,
+                                context_ids: Optional[List[str]] = None) -> AsyncIterator[str]:
+    if not OPENAI_API_KEY:
+        return
+    key = _context_key(contexts, context_ids, max_tokens)
+    cached = _cache.get(question, key)
+    if cached is not None:
+        yield cached
+        return
+    parts = []
+    try:
+        stream = await get_async_client().chat.completions.create(
+            model=LLM_MODEL,
+            messages=_messages(question, contexts),
+            max_tokens=max_tokens,
+            temperature=0.0,
+            stream=True,
+        )
+        async for chunk in stream:
+            delta = chunk.choices[0].delta.content if chunk.choices else None
+            if delta:
+                parts.append(delta)
+                yield delta
+    except Exception as e:
+        yield f"(LLM error: {e})"
+        return
+    _cache.put(question, key, "".join(parts).strip())
+
+
 if __name__ == "__main__":
     example_question = "HVAC system temperature anomaly detected."
     example_contexts = [
         "Check the air filters for dust accumulation.",
         "Verify that the thermostat sensors are calibrated."
     ]
-    print(llm_summarize(example_question, example_contexts))
\ No newline at end of file
+    print(llm_summarize(example_question, example_contexts))
@@ -0,0 +1,221 @@
+import functools
+import threading
+import time
+from bisect import bisect_left
+from collections import deque
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from backend.config import TRACING
+
+BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+PREFIX = "rag_"
+
+LabelKey = Tuple[Tuple[str, str], ...]
+
+
+def _key(labels: dict) -> LabelKey:
+    return tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+
+class _Histogram:
+    __slots__ = ("counts", "sum", "count", "recent")
+
+    def __init__(self):
+        self.counts = [0] * (len(BUCKETS) + 1)
+        self.sum = 0.0
+        self.count = 0
+        self.recent = deque(maxlen=512)  # raw samples for the dashboard percentiles
+
+    def observe(self, value: float):
+        self.counts[bisect_left(BUCKETS, value)] += 1
+        self.sum += value
+        self.count += 1
+        self.recent.append(value)
+
+
+class Metrics:
+    """Process-wide counters, latency histograms and a ring buffer of recent spans.
+
+    Everything is a no-op while disabled: `span()` hands out a shared null
+    context and `traced` wrappers only check one flag before calling through.
+    """
+
+    def __init__(self, enabled: bool = TRACING, keep_spans: int = 200):
+        self.enabled = enabled
+        self._lock = threading.Lock()
+        self._counters: Dict[str, Dict[LabelKey, float]] = {}
+        self._histograms: Dict[str, Dict[LabelKey, _Histogram]] = {}
+        self._spans = deque(maxlen=keep_spans)
+        self._local = threading.local()
+
+    def inc(self, name: str, value: float = 1.0, **labels):
+        if not self.enabled:
+            return
+        key = _key(labels)
+        with self._lock:
+            series = self._counters.setdefault(name, {})
+            series[key] = series.get(key, 0.0) + value
+
+    def observe(self, name: str, seconds: float, **labels):
+        if not self.enabled:
+            return
+        key = _key(labels)
+        with self._lock:
+            series = self._histograms.setdefault(name, {})
+            h = series.get(key)
+            if h is None:
+                h = series[key] = _Histogram()
+            h.observe(seconds)
+
+    def _record(self, name: str, parent: Optional[str], elapsed: float, error: Optional[str], labels: dict):
+        key = _key(labels) if labels else ()
+        with self._lock:
+            series = self._histograms.setdefault(name, {})
+            h = series.get(key)
+            if h is None:
+                h = series[key] = _Histogram()
+            h.observe(elapsed)
+            self._spans.append({"name": name, "parent": parent, "ms": elapsed * 1000, "error": error, **labels})
+        if error:
+            self.inc(f"{name}_errors", **labels)
+
+    def _stack(self) -> list:
+        stack = getattr(self._local, "stack", None)
+        if stack is None:
+            stack = self._local.stack = []
+        return stack
+
+    def span(self, name: str, **labels):
+        """Times a block into the `name` histogram and the recent-spans buffer."""
+        if not self.enabled:
+            return _NULL
+        return _Span(self, name, labels)
+
+    def reset(self):
+        with self._lock:
+            self._counters.clear()
+            self._histograms.clear()
+            self._spans.clear()
+
+    # ---- Export ----
+    def summary(self) -> List[dict]:
+        """One row per histogram series: calls, total, mean and recent p50/p95/max in ms."""
+        rows = []
+        with self._lock:
+            items = [(n, k, h.count, h.sum, list(h.recent))
+                     for n, series in self._histograms.items() for k, h in series.items()]
+        for name, key, count, total, recent in items:
+            r = np.asarray(recent) * 1000
+            rows.append({"span": name + "".join(f" {k}={v}" for k, v in key), "calls": count,
+                         "total_s": total, "mean_ms": total / count * 1000 if count else 0.0,
+                         "p50_ms": float(np.percentile(r, 50)) if len(r) else None,
+                         "p95_ms": float(np.percentile(r, 95)) if len(r) else None,
+                         "max_ms": float(r.max()) if len(r) else None})
+        return sorted(rows, key=lambda row: -row["total_s"])
+
+    def counters(self) -> Dict[str, float]:
+        with self._lock:
+            return {name + "".join(f" {k}={v}" for k, v in key): value
+                    for name, series in self._counters.items() for key, value in series.items()}
+
+    def recent_spans(self, n: int = 50) -> List[dict]:
+        with self._lock:
+            return list(self._spans)[-n:]
+
+    def to_prometheus(self) -> str:
+        """Prometheus text exposition format (version 0.0.4)."""
+        def labels(key: LabelKey, extra: Optional[Tuple[str, str]] = None) -> str:
+            pairs = list(key) + ([extra] if extra else [])
+            if not pairs:
+                return ""
+            return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in pairs) + "}"
+
+        lines = []
+        with self._lock:
+            for name, series in sorted(self._counters.items()):
+                metric = PREFIX + _sanitize(name) + "_total"
+                lines.append(f"# TYPE {metric} counter")
+                lines.extend(f"{metric}{labels(k)} {v:g}" for k, v in series.items())
+            for name, series in sorted(self._histograms.items()):
+                metric = PREFIX + _sanitize(name) + "_seconds"
+                lines.append(f"# TYPE {metric} histogram")
+                for k, h in series.items():
+                    cumulative = 0
+                    for bound, c in zip(BUCKETS + (float("inf"),), h.counts):
+                        cumulative += c
+                        le = "+Inf" if bound == float("inf") else f"{bound:g}"
+                        lines.append(f"{metric}_bucket{labels(k, ('le', le))} {cumulative}")
+                    lines.append(f"{metric}_sum{labels(k)} {h.sum:.6f}")
+                    lines.append(f"{metric}_count{labels(k)} {h.count}")
+        return "\n".join(lines) + "\n"
+
+
+class _Span:
+    __slots__ = ("metrics", "name", "labels", "start", "parent")
+
+    def __init__(self, metrics: Metrics, name: str, labels: dict):
+        self.metrics = metrics
+        self.name = name
+        self.labels = labels
+
+    def __enter__(self):
+        stack = self.metrics._stack()
+        self.parent = stack[-1] if stack else None
+        stack.append(self.name)
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        elapsed = time.perf_counter() - self.start
+        self.metrics._stack().pop()
+        self.metrics._record(self.name, self.parent, elapsed, exc_type.__name__ if exc_type else None, self.labels)
+        return False
+
+
+class _NullSpan:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NULL = _NullSpan()
+
+
+def _sanitize(name: str) -> str:
+    return "".join(c if c.isalnum() or c == "_" else "_" for c in name)
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+metrics = Metrics()
+
+
+def span(name: str, **labels):
+    return metrics.span(name, **labels)
+
+
+def inc(name: str, value: float = 1.0, **labels):
+    metrics.inc(name, value, **labels)
+
+
+def traced(name: Optional[str] = None):
+    """Decorator form of span(); costs one flag check per call while tracing is off."""
+    def decorate(fn):
+        span_name = name or fn.__name__
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            if not metrics.enabled:
+                return fn(*args, **kwargs)
+            with _Span(metrics, span_name, {}):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorate
@@ -0,0 +1,130 @@
+import hashlib
+import os
+import tempfile
+import threading
+import time
+from typing import Dict, Optional
+
+import numpy as np
+import pandas as pd
+
+from backend.config import MODEL_DIR, MODEL_MAX_AGE_S, DRIFT_Z
+from backend.models import AnomalyModel, default_features, train_anomaly_model
+
+
+class ModelRegistry:
+    """Keeps fitted AnomalyModels in memory and on disk.
+
+    Models are keyed by feature set, device and training window length. A model
+    is only refit when it is older than `max_age` seconds or the incoming window
+    has drifted more than `drift_z` training standard deviations on any feature.
+    An in-memory copy is reloaded once another process has saved a newer file.
+    """
+
+    def __init__(self, root: str = MODEL_DIR, max_age: float = MODEL_MAX_AGE_S, drift_z: float = DRIFT_Z):
+        self.root = str(root)
+        self.max_age = max_age
+        self.drift_z = drift_z
+        self._models: Dict[str, AnomalyModel] = {}
+        self._mtimes: Dict[str, int] = {}
+        self._lock = threading.RLock()
+        os.makedirs(self.root, exist_ok=True)
+
+    @staticmethod
+    def key(features, device: Optional[str] = None, window: Optional[int] = None) -> str:
+        raw = "|".join([",".join(features), device or "*", str(window or 0)])
+        return hashlib.sha1(raw.encode("utf-8")).hexdigest()[:16]
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.root, f"{key}.joblib")
+
+    def _mtime(self, key: str) -> Optional[int]:
+        try:
+            return os.stat(self._path(key)).st_mtime_ns
+        except OSError:
+            return None
+
+    def get(self, key: str) -> Optional[AnomalyModel]:
+        with self._lock:
+            model = self._models.get(key)
+            mtime = self._mtime(key)
+            # the file is replaced atomically by save(), so a changed mtime means another writer refit it
+            if mtime is not None and (model is None or mtime != self._mtimes.get(key)):
+                import joblib
+                try:
+                    model = joblib.load(self._path(key))
+                except Exception:
+                    return model
+                self._models[key] = model
+                self._mtimes[key] = mtime
+            return model
+
+    def save(self, key: str, model: AnomalyModel):
+        import joblib
+        with self._lock:
+            self._models[key] = model
+            # one temp file per writer: API threads and pool workers may save the same key at once
+            fd, tmp = tempfile.mkstemp(dir=self.root, prefix=f".{key}.", suffix=".tmp")
+            os.close(fd)
+            try:
+                joblib.dump(model, tmp)
+                os.replace(tmp, self._path(key))
+            except BaseException:
+                os.unlink(tmp)
+                raise
+            self._mtimes[key] = self._mtime(key)
+
+    def evict(self, keys):
+        """Drops in-memory copies so the next get() reloads what another process saved."""
+        with self._lock:
+            for key in keys:
+                self._models.pop(key, None)
+                self._mtimes.pop(key, None)
+
+    def drift(self, model: AnomalyModel, df: pd.DataFrame) -> float:
+        if not model.mean or df.empty:
+            return 0.0
+        mean = df[model.features].mean().values
+        std = np.maximum(np.asarray(model.std), 1e-9)
+        return float(np.nanmax(np.abs(mean - np.asarray(model.mean)) / std))
+
+    def needs_retrain(self, model: Optional[AnomalyModel], df: pd.DataFrame) -> bool:
+        if model is None:
+            return True
+        if self.max_age and time.time() - model.trained_at > self.max_age:
+            return True
+        return self.drift(model, df) > self.drift_z
+
+    def get_or_train(self, df: pd.DataFrame, device: Optional[str] = None, feature_cols=None,
+                     window: Optional[int] = None, force: bool = False) -> AnomalyModel:
+        if device is not None and "device_id" in df.columns:
+            df = df[df["device_id"] == device]
+        feature_cols = list(feature_cols or default_features(df))
+        key = self.key(feature_cols, device, window or len(df))
+        with self._lock:
+            model = self.get(key)
+            if force or self.needs_retrain(model, df):
+                model = train_anomaly_model(df, feature_cols)
+                self.save(key, model)
+            return model
+
+    def load_all(self) -> int:
+        """Loads every saved model into memory (cold start without fitting)."""
+        n = 0
+        for name in os.listdir(self.root):
+            if name.endswith(".joblib") and self.get(name[:-len(".joblib")]) is not None:
+                n += 1
+        return n
+
+
+_registry: Optional[ModelRegistry] = None
+_registry_lock = threading.Lock()
+
+
+def get_registry() -> ModelRegistry:
+    global _registry
+    with _registry_lock:
+        if _registry is None:
+            _registry = ModelRegistry()
+            _registry.load_all()
+        return _registry
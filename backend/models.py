@@ -1,23 +1,40 @@
+import time
 import numpy as np
 import pandas as pd
-from sklearn.ensemble import IsolationForest
-from dataclasses import dataclass
+from dataclasses import dataclass, field
+from typing import TYPE_CHECKING
+from backend.metrics import traced
+
+if TYPE_CHECKING:
+    from sklearn.ensemble import IsolationForest
 
 @dataclass
 class AnomalyModel:
-    model: IsolationForest
+    model: "IsolationForest"
     features: list
+    trained_at: float = 0.0
+    n_samples: int = 0
+    mean: list = field(default_factory=list)
+    std: list = field(default_factory=list)
+
+def default_features(df: pd.DataFrame) -> list:
+    return [c for c in df.columns if c not in ("timestamp","device_id")]
 
+@traced()
 def train_anomaly_model(df: pd.DataFrame, feature_cols=None) -> AnomalyModel:
     if feature_cols is None:
-        feature_cols = [c for c in df.columns if c not in ("timestamp","device_id")]
-    X = df[feature_cols].fillna(method="ffill").fillna(0.0).values
+        feature_cols = default_features(df)
+    # sklearn takes seconds to import, so it loads with the first model rather than with the app
+    from sklearn.ensemble import IsolationForest
+    X = df[feature_cols].ffill().fillna(0.0).values
     iso = IsolationForest(contamination=0.02, random_state=42)
     iso.fit(X)
-    return AnomalyModel(model=iso, features=feature_cols)
+    return AnomalyModel(model=iso, features=list(feature_cols), trained_at=time.time(),
+                        n_samples=len(X), mean=X.mean(axis=0).tolist(), std=X.std(axis=0).tolist())
 
+@traced()
 def score_anomalies(model: AnomalyModel, df: pd.DataFrame):
-    X = df[model.features].fillna(method="ffill").fillna(0.0).values
+    X = df[model.features].ffill().fillna(0.0).values
     scores = -model.model.score_samples(X)
     return scores
 
@@ -30,4 +47,116 @@ def estimate_simple_rul(series: pd.Series, upper_limit: float) -> float:
     if a <= 0:
         return float("inf")
     steps_to_threshold = (upper_limit - b) / a
-    return max(0.0, steps_to_threshold)
\ No newline at end of file
+    return max(0.0, steps_to_threshold)
+
+def _rul_from_sums(n, sy, sxy, upper):
+    # closed-form least squares with x = 0..n-1, same fit as np.polyfit(x, y, 1)
+    n = n.astype(float)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        sx = n * (n - 1) / 2
+        sxx = (n - 1) * n * (2 * n - 1) / 6
+        a = (n * sxy - sx * sy) / (n * sxx - sx * sx)
+        b = (sy - a * sx) / n
+        rul = np.maximum(0.0, (upper - b) / a)
+    rul = np.where(a <= 0, np.inf, rul)
+    return np.where(n < 5, np.nan, rul)
+
+def estimate_rul_batch(Y: np.ndarray, upper_limits, window: int = 50) -> np.ndarray:
+    """Vectorized estimate_simple_rul over rows of Y (n_series, n_points).
+
+    Rows may be right-padded with NaN when series have fewer points; only the
+    last `window` valid points of each row are used.
+    """
+    Y = np.asarray(Y, dtype=float)
+    if Y.ndim == 1:
+        Y = Y[None, :]
+    valid = ~np.isnan(Y)
+    n_valid = valid.sum(axis=1)
+    if Y.shape[1] > window:
+        # shift each row so its last `window` valid points start at column 0
+        start = np.maximum(n_valid - window, 0)
+        cols = start[:, None] + np.arange(window)
+        Y = np.take_along_axis(Y, np.minimum(cols, Y.shape[1] - 1), axis=1)
+        Y[cols >= n_valid[:, None]] = np.nan
+        valid = ~np.isnan(Y)
+    n = valid.sum(axis=1)
+    y0 = np.where(valid, Y, 0.0)
+    x = np.arange(Y.shape[1])
+    sy = y0.sum(axis=1)
+    sxy = (y0 * x).sum(axis=1)
+    return _rul_from_sums(n, sy, sxy, np.broadcast_to(np.asarray(upper_limits, dtype=float), n.shape))
+
+def fleet_rul(df: pd.DataFrame, upper_limits: dict, window: int = 50) -> pd.DataFrame:
+    """RUL for every device_id x metric in `upper_limits`, in one vectorized pass."""
+    metrics = list(upper_limits)
+    if "timestamp" in df.columns:
+        df = df.sort_values("timestamp", kind="stable")
+    codes, devices = pd.factorize(df["device_id"])
+    from_end = df.groupby(codes).cumcount(ascending=False).to_numpy()
+    keep = from_end < window
+    counts = np.bincount(codes[keep], minlength=len(devices))
+    pos = counts[codes[keep]] - 1 - from_end[keep]
+    Y = np.full((len(devices), len(metrics), window), np.nan)
+    Y[codes[keep], :, pos] = df.loc[keep, metrics].to_numpy(dtype=float)
+    limits = np.tile([upper_limits[m] for m in metrics], len(devices))
+    rul = estimate_rul_batch(Y.reshape(-1, window), limits, window)
+    return pd.DataFrame({
+        "device_id": np.repeat(np.asarray(devices), len(metrics)),
+        "metric": np.tile(metrics, len(devices)),
+        "upper_limit": limits,
+        "rul_steps": rul,
+    })
+
+
+class RunningRUL:
+    """Sliding-window RUL for many series kept as running sums.
+
+    `update()` takes one new sample per series (NaN = no sample) and adjusts
+    the sums in O(1) per series instead of refitting the last `window` points.
+    """
+
+    def __init__(self, n_series: int, upper_limits, window: int = 50, refresh_every: int = 10000):
+        self.window = window
+        self.upper = np.broadcast_to(np.asarray(upper_limits, dtype=float), (n_series,)).copy()
+        self.buf = np.full((n_series, window), np.nan)
+        self.count = np.zeros(n_series, dtype=np.int64)
+        self.sy = np.zeros(n_series)
+        self.sxy = np.zeros(n_series)
+        self.refresh_every = refresh_every
+        self._updates = 0
+
+    def update(self, values):
+        v = np.asarray(values, dtype=float)
+        has = ~np.isnan(v)
+        full = has & (self.count >= self.window)
+        filling = has & ~full
+        slot = self.count % self.window
+        # series still filling: append at x = count
+        idx = np.flatnonzero(filling)
+        self.sxy[idx] += self.count[idx] * v[idx]
+        self.sy[idx] += v[idx]
+        # full series: drop the oldest point, shift x down by one, append at x = window-1
+        idx = np.flatnonzero(full)
+        old = self.buf[idx, slot[idx]]
+        self.sxy[idx] += -(self.sy[idx] - old) + (self.window - 1) * v[idx]
+        self.sy[idx] += v[idx] - old
+        self.buf[has, slot[has]] = v[has]
+        self.count[has] += 1
+        self._updates += 1
+        if self._updates % self.refresh_every == 0:
+            self.refresh()
+
+    def refresh(self):
+        """Recomputes the sums from the ring buffer to shed accumulated float error."""
+        n = np.minimum(self.count, self.window)
+        start = np.where(self.count > self.window, self.count % self.window, 0)
+        order = (start[:, None] + np.arange(self.window)) % self.window
+        Y = np.take_along_axis(self.buf, order, axis=1)
+        x = np.arange(self.window)
+        valid = x < n[:, None]
+        y0 = np.where(valid, Y, 0.0)
+        self.sy = y0.sum(axis=1)
+        self.sxy = (y0 * x).sum(axis=1)
+
+    def estimate(self) -> np.ndarray:
+        return _rul_from_sums(np.minimum(self.count, self.window), self.sy, self.sxy, self.upper)
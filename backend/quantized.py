@@ -0,0 +1,363 @@
+import sys
+import pathlib
+sys.path.append(str(pathlib.Path(__file__).resolve().parent.parent))
+
+import argparse
+import json
+import os
+import time
+from pathlib import Path
+from typing import Callable, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from backend.config import PQ_SUBVECTORS, RERANK_FACTOR
+
+BLOCK = 1 << 16  # rows scored per step, bounds the temporary float32 buffers
+RETRAIN_GROWTH = 2.0  # retrain scales/codebooks once the index is this many times the rows they were fit on
+
+# ids -> float32 rows in the same order; NaN rows for ids that are gone
+Fetch = Callable[[List[str]], np.ndarray]
+
+
+def _kmeans(X: np.ndarray, k: int, iters: int = 12, seed: int = 0) -> np.ndarray:
+    rng = np.random.default_rng(seed)
+    k = min(k, len(X))
+    C = X[rng.choice(len(X), k, replace=False)].astype(np.float32)
+    for _ in range(iters):
+        d = (X * X).sum(1)[:, None] - 2 * X @ C.T + (C * C).sum(1)[None, :]
+        assign = d.argmin(1)
+        counts = np.bincount(assign, minlength=k)
+        sums = np.zeros_like(C)
+        np.add.at(sums, assign, X)
+        filled = counts > 0  # empty clusters keep their old centroid
+        C[filled] = sums[filled] / counts[filled, None]
+    return C
+
+
+def _nearest(X: np.ndarray, C: np.ndarray) -> np.ndarray:
+    out = np.empty(len(X), dtype=np.uint8)
+    cc = (C * C).sum(1)
+    for lo in range(0, len(X), BLOCK):
+        x = X[lo:lo + BLOCK]
+        out[lo:lo + BLOCK] = (cc[None, :] - 2 * x @ C.T).argmin(1)
+    return out
+
+
+def _as_matrix(embeddings, n: int) -> np.ndarray:
+    X = np.asarray(embeddings, dtype=np.float32)
+    return X.reshape(n, -1) if X.ndim != 2 else X
+
+
+class QuantizedIndex:
+    """Memory-mapped int8 or product-quantized codes, re-ranked with Chroma's float32 vectors.
+
+    Files, next to the Chroma store:
+      <collection>_<kind>_codes.npy  int8 (n, d) or uint8 PQ codes (n, m)
+      <collection>_<kind>_meta.npz   ids, squared norms, equipment per row, scales or codebooks
+
+    Candidates come from the codes (squared L2 from the quantized vectors);
+    the best `k * rerank` are re-scored with their float32 embeddings fetched
+    from Chroma, so distances match Chroma's default l2 space and no second
+    full-precision copy is kept. Equipment filters are packed bitmaps, one
+    bit per vector, built at load time.
+
+    The codes shrink what a query scans, not what is stored: Chroma keeps
+    its float32 vectors and HNSW index for the re-ranking, and these files
+    come on top of that (see disk_bytes() and recall_vs_chroma()).
+
+    Scales and codebooks are fit once; update() encodes new vectors with them
+    (int8 values beyond the fitted range are clipped) until the index has
+    grown RETRAIN_GROWTH times past the rows they were fit on.
+    """
+
+    def __init__(self, kind: str, ids: np.ndarray, norms: np.ndarray, codes: np.ndarray, equipment: np.ndarray,
+                 equipment_names: np.ndarray, scale: Optional[np.ndarray] = None,
+                 codebooks: Optional[np.ndarray] = None, trained_on: int = 0):
+        self.kind = kind
+        self.ids = ids
+        self._ids = ids.tolist()
+        self.norms = norms
+        self.codes = codes
+        self.equipment = equipment  # per-row index into equipment_names
+        self.equipment_names = equipment_names
+        self.scale = scale
+        self.codebooks = codebooks
+        self.trained_on = trained_on
+        self._bitmaps = {name: np.packbits(equipment == i) for i, name in enumerate(equipment_names.tolist())}
+
+    def __len__(self):
+        return len(self._ids)
+
+    @staticmethod
+    def paths(root, collection: str, kind: str) -> Tuple[Path, Path]:
+        base = Path(root) / f"{collection}_{kind}"
+        return base.with_name(base.name + "_codes.npy"), base.with_name(base.name + "_meta.npz")
+
+    @property
+    def needs_retrain(self) -> bool:
+        return len(self) > RETRAIN_GROWTH * max(1, self.trained_on)
+
+    # ---- Build ----
+    @classmethod
+    def build(cls, root, collection: str, kind: str, ids: Sequence[str], embeddings, metadatas: Sequence[dict],
+              subvectors: int = PQ_SUBVECTORS) -> "QuantizedIndex":
+        """Fits the scales or codebooks on `embeddings`, encodes them and writes the files."""
+        X = _as_matrix(embeddings, len(ids))
+        n, d = X.shape
+        scale = codebooks = None
+        if kind == "int8":
+            scale = np.abs(X).max(0) / 127.0 if n else np.ones(d, np.float32)
+            scale = np.where(scale > 0, scale, 1.0).astype(np.float32)
+        elif kind == "pq":
+            m = subvectors or max(1, d // 8)
+            while d % m:
+                m -= 1
+            sub = d // m
+            sample = X[np.random.default_rng(0).choice(n, min(n, 20000), replace=False)] if n else X
+            codebooks = np.zeros((m, 256, sub), dtype=np.float32)
+            for j in range(m if n else 0):
+                C = _kmeans(sample[:, j * sub:(j + 1) * sub], 256)
+                codebooks[j, :len(C)] = C  # unused centroids are never assigned
+        else:
+            raise ValueError(f"unknown quantized index kind: {kind}")
+
+        index = cls(kind, np.array([], dtype=str), np.zeros(0, np.float32), np.zeros((0, 0)),
+                    np.zeros(0, np.int16), np.array([], dtype=str), scale, codebooks, trained_on=n)
+        return index._rewrite(root, collection, list(ids), index._encode(X), (X * X).sum(1),
+                              [(md or {}).get("equipment") or "" for md in metadatas])
+
+    def _encode(self, X: np.ndarray) -> np.ndarray:
+        if self.kind == "int8":
+            return np.clip(np.rint(X / self.scale), -127, 127).astype(np.int8)
+        m, _, sub = self.codebooks.shape
+        codes = np.zeros((len(X), m), dtype=np.uint8)
+        for j in range(m if len(X) else 0):
+            codes[:, j] = _nearest(X[:, j * sub:(j + 1) * sub], self.codebooks[j])
+        return codes
+
+    def update(self, root, collection: str, added: Tuple[list, list, list] = ([], [], []),
+               deleted: Sequence[str] = (), updated: Tuple[list, list] = ([], [])) -> "QuantizedIndex":
+        """Deletes, re-labels and adds rows with the current scales/codebooks; returns the rewritten index.
+
+        `added` is (ids, embeddings, metadatas); an added id that already
+        exists replaces the old row. `updated` is (ids, metadatas) for chunks
+        whose metadata changed.
+        """
+        add_ids = list(added[0])
+        drop = set(deleted) | set(add_ids)
+        keep = np.array([i not in drop for i in self._ids], dtype=bool)
+        names = self.equipment_names.tolist()
+        equipment = [names[c] for c in self.equipment[keep].tolist()]
+        ids = [i for i, k in zip(self._ids, keep) if k]
+        if updated[0]:
+            pos = {doc_id: j for j, doc_id in enumerate(ids)}
+            for doc_id, md in zip(*updated):
+                if doc_id in pos:
+                    equipment[pos[doc_id]] = (md or {}).get("equipment") or ""
+        codes, norms = np.asarray(self.codes[keep]), self.norms[keep]
+        if add_ids:
+            X = _as_matrix(added[1], len(add_ids))
+            codes = np.concatenate([codes, self._encode(X)])
+            norms = np.concatenate([norms, (X * X).sum(1)])
+            equipment += [(md or {}).get("equipment") or "" for md in added[2]]
+            ids += add_ids
+        return self._rewrite(root, collection, ids, codes, norms, equipment)
+
+    def _rewrite(self, root, collection: str, ids: List[str], codes: np.ndarray, norms: np.ndarray,
+                 equipment: List[str]) -> "QuantizedIndex":
+        codes_path, meta_path = self.paths(root, collection, self.kind)
+        codes_path.parent.mkdir(parents=True, exist_ok=True)
+        names = sorted(set(equipment))
+        code_of = {name: i for i, name in enumerate(names)}
+        meta = {"ids": np.array(ids, dtype=str), "norms": np.asarray(norms, dtype=np.float32),
+                "equipment": np.array([code_of[e] for e in equipment], dtype=np.int16),
+                "equipment_names": np.array(names, dtype=str), "trained_on": np.int64(self.trained_on)}
+        if self.scale is not None:
+            meta["scale"] = self.scale
+        if self.codebooks is not None:
+            meta["codebooks"] = self.codebooks
+        # the old mapping stays valid until both files are replaced
+        tmp = codes_path.with_name(codes_path.stem + ".tmp.npy")
+        np.save(tmp, codes)
+        os.replace(tmp, codes_path)
+        tmp = meta_path.with_name(meta_path.stem + ".tmp.npz")
+        np.savez(tmp, **meta)
+        os.replace(tmp, meta_path)
+        return self.load(root, collection, self.kind)
+
+    @classmethod
+    def load(cls, root, collection: str, kind: str) -> Optional["QuantizedIndex"]:
+        codes_path, meta_path = cls.paths(root, collection, kind)
+        try:
+            with np.load(meta_path, allow_pickle=False) as z:
+                meta = {name: z[name] for name in z.files}
+            codes = np.load(codes_path, mmap_mode="r")
+        except (OSError, ValueError):
+            return None
+        if len(codes) != len(meta["ids"]):
+            return None  # caught between the two replaces of a rewrite
+        return cls(kind, meta["ids"], meta["norms"], codes, meta["equipment"], meta["equipment_names"],
+                   scale=meta.get("scale"), codebooks=meta.get("codebooks"), trained_on=int(meta["trained_on"]))
+
+    @classmethod
+    def disk_bytes(cls, root, collection: str, kind: str) -> int:
+        return sum(p.stat().st_size for p in cls.paths(root, collection, kind) if p.exists())
+
+    @classmethod
+    def remove(cls, root, collection: str, kind: str):
+        for path in cls.paths(root, collection, kind):
+            path.unlink(missing_ok=True)
+
+    # ---- Search ----
+    def _rows(self, equipment: Optional[str]) -> Optional[np.ndarray]:
+        if not equipment:
+            return None
+        bits = self._bitmaps.get(equipment)
+        if bits is None:
+            return np.zeros(0, dtype=np.int64)
+        return np.flatnonzero(np.unpackbits(bits, count=len(self)))
+
+    def _approx(self, Q: np.ndarray, rows: Optional[np.ndarray], lo: int, hi: int) -> np.ndarray:
+        """Approximate squared L2 from the queries to rows[lo:hi] (or lo:hi without a filter)."""
+        sel = slice(lo, hi) if rows is None else rows[lo:hi]
+        codes = self.codes[sel]
+        if self.kind == "int8":
+            dot = codes.astype(np.float32) @ (Q * self.scale).T
+            return self.norms[sel][:, None] - 2 * dot + (Q * Q).sum(1)[None, :]
+        m, _, sub = self.codebooks.shape
+        out = np.zeros((len(codes), len(Q)), dtype=np.float32)
+        for j in range(m):
+            C = self.codebooks[j]
+            q = Q[:, j * sub:(j + 1) * sub]
+            # (256, b) table of subspace distances, gathered by code
+            table = (C * C).sum(1)[:, None] - 2 * C @ q.T + (q * q).sum(1)[None, :]
+            out += table[codes[:, j]]
+        return out
+
+    def search(self, queries, k: int, equipment: Optional[str] = None, rerank: int = RERANK_FACTOR,
+               fetch: Optional[Fetch] = None) -> List[List[Tuple[str, float]]]:
+        """Top-`k` (id, squared L2 distance) per query vector.
+
+        `fetch` returns the float32 embeddings of candidate ids (one call per
+        batch of queries); without it the approximate distances are returned.
+        """
+        Q = np.atleast_2d(np.asarray(queries, dtype=np.float32))
+        rows = self._rows(equipment)
+        n = len(self) if rows is None else len(rows)
+        if not n:
+            return [[] for _ in Q]
+        n_cand = min(n, max(k * max(1, rerank), k)) if fetch is not None else min(n, k)
+        best_d = np.full((len(Q), 0), np.inf, dtype=np.float32)
+        best_i = np.zeros((len(Q), 0), dtype=np.int64)
+        for lo in range(0, n, BLOCK):
+            hi = min(n, lo + BLOCK)
+            d = self._approx(Q, rows, lo, hi).T  # (b, block)
+            idx = np.arange(lo, hi) if rows is None else rows[lo:hi]
+            d = np.concatenate([best_d, d], axis=1)
+            idx = np.concatenate([best_i, np.broadcast_to(idx, (len(Q), hi - lo))], axis=1)
+            if d.shape[1] > n_cand:
+                part = np.argpartition(d, n_cand - 1, axis=1)[:, :n_cand]
+                d = np.take_along_axis(d, part, axis=1)
+                idx = np.take_along_axis(idx, part, axis=1)
+            best_d, best_i = d, idx
+
+        if fetch is None:
+            order = np.argsort(best_d, axis=1, kind="stable")[:, :k]
+            return [[(self._ids[best_i[qi, t]], float(best_d[qi, t])) for t in order[qi]] for qi in range(len(Q))]
+
+        # one fetch for the union of all candidates
+        union = np.unique(best_i)
+        vectors = np.asarray(fetch([self._ids[i] for i in union]), dtype=np.float32)
+        if vectors.ndim != 2 or vectors.shape[1] != Q.shape[1]:
+            vectors = np.full((len(union), Q.shape[1]), np.nan, dtype=np.float32)  # none of them left
+        out = []
+        for qi, q in enumerate(Q):
+            cand = np.searchsorted(union, np.unique(best_i[qi]))
+            exact = ((vectors[cand] - q) ** 2).sum(1)
+            top = [t for t in np.argsort(exact, kind="stable") if np.isfinite(exact[t])][:k]
+            out.append([(self._ids[union[cand[t]]], float(exact[t])) for t in top])
+        return out
+
+    def nbytes(self) -> dict:
+        """Resident bytes of the search structures next to the size of the float32 vectors they stand for.
+
+        Only what a query scans; the float32 copy in Chroma is not included.
+        """
+        meta = self.norms.nbytes + self.equipment.nbytes + sum(b.nbytes for b in self._bitmaps.values())
+        meta += self.scale.nbytes if self.scale is not None else self.codebooks.nbytes
+        dim = self.codes.shape[1] if self.kind == "int8" else self.codebooks.shape[0] * self.codebooks.shape[2]
+        return {"codes": int(self.codes.nbytes), "meta": int(meta), "float32": int(len(self) * dim * 4)}
+
+
+def chroma_fetch(collection) -> Fetch:
+    """Fetch for search(): float32 embeddings of the given ids from a Chroma collection."""
+    def fetch(ids: List[str]) -> np.ndarray:
+        got = collection.get(ids=list(ids), include=["embeddings"])
+        emb = np.asarray(got["embeddings"], dtype=np.float32)
+        out = np.full((len(ids), emb.shape[1] if emb.ndim == 2 else 0), np.nan, dtype=np.float32)
+        pos = {doc_id: j for j, doc_id in enumerate(ids)}
+        for doc_id, row in zip(got["ids"], emb):
+            out[pos[doc_id]] = row
+        return out
+    return fetch
+
+
+def chroma_bytes(root) -> int:
+    """On-disk size of the Chroma store in `root`: its sqlite files and segment directories."""
+    root = Path(root)
+    total = 0
+    for p in (root.iterdir() if root.exists() else ()):
+        if p.is_dir():
+            total += sum(f.stat().st_size for f in p.rglob("*") if f.is_file())
+        elif p.name.startswith("chroma.sqlite3"):
+            total += p.stat().st_size
+    return total
+
+
+def recall_vs_chroma(service, queries: List[str], k: int, kind: str, equipment: Optional[str] = None) -> dict:
+    """recall@k of the quantized index against the Chroma results for the same query embeddings.
+
+    `scan_compression` compares the scanned codes with the float32 vectors;
+    `total_bytes` is the real footprint, Chroma's store plus the index files.
+    """
+    index = QuantizedIndex.load(service.chroma_dir, service.collection_name, kind)
+    if index is None:
+        raise FileNotFoundError(f"no {kind} index for collection {service.collection_name!r}; run build_index()")
+    embeddings = service.embed(queries)
+    t0 = time.perf_counter()
+    res = service.collection.query(query_embeddings=embeddings, n_results=k,
+                                   where={"equipment": equipment} if equipment else None)
+    chroma_s = time.perf_counter() - t0
+    t0 = time.perf_counter()
+    found = index.search(embeddings, k, equipment, fetch=chroma_fetch(service.collection))
+    quant_s = time.perf_counter() - t0
+    overlap = [len(set(res["ids"][i]) & {doc_id for doc_id, _ in found[i]}) / max(1, len(res["ids"][i]))
+               for i in range(len(queries))]
+    size = index.nbytes()
+    chroma = chroma_bytes(service.chroma_dir)
+    on_disk = QuantizedIndex.disk_bytes(service.chroma_dir, service.collection_name, kind)
+    return {"kind": kind, "vectors": len(index), "k": k, f"recall@{k}": float(np.mean(overlap)),
+            "chroma_ms_per_query": chroma_s / len(queries) * 1000,
+            "quantized_ms_per_query": quant_s / len(queries) * 1000,
+            "scan_bytes": size["codes"] + size["meta"], "float32_bytes": size["float32"],
+            "scan_compression": size["float32"] / max(1, size["codes"] + size["meta"]),
+            "chroma_bytes": chroma, "index_bytes": on_disk, "total_bytes": chroma + on_disk}
+
+
+if __name__ == "__main__":
+    from backend.retriever import get_service
+
+    parser = argparse.ArgumentParser(description="Build a quantized index from the Chroma collection and compare recall.")
+    parser.add_argument("--kind", choices=["int8", "pq"], default="int8")
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--queries", type=int, default=200, help="stored chunks reused as queries")
+    a = parser.parse_args()
+
+    svc = get_service()
+    got = svc.collection.get(include=["embeddings", "metadatas", "documents"])
+    QuantizedIndex.build(svc.chroma_dir, svc.collection_name, a.kind, got["ids"], got["embeddings"], got["metadatas"])
+    rng = np.random.default_rng(0)
+    docs = got["documents"]
+    sample = [docs[i][:300] for i in rng.choice(len(docs), min(a.queries, len(docs)), replace=False)]
+    print(json.dumps(recall_vs_chroma(svc, sample, a.k, a.kind), indent=2))
@@ -1,7 +1,12 @@
 import sys
 import os
-import re
 import glob
+import json
+import hashlib
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 from typing import List, Optional
 
@@ -10,15 +15,15 @@ PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 if PROJECT_ROOT not in sys.path:
     sys.path.insert(0, PROJECT_ROOT)
 
-import chromadb
-from chromadb.utils import embedding_functions
-from backend.config import CHROMA_DIR, DOCS_DIR, EMBEDDING_MODEL, CHUNK_SIZE, CHUNK_OVERLAP, TOP_K, OPENAI_API_KEY
-
-
-# ---- Initialize Chroma Client ----
-def get_chroma_client():
-    from chromadb import PersistentClient
-    return PersistentClient(path=str(CHROMA_DIR))
+import numpy as np
+from backend.config import CHROMA_DIR, DOCS_DIR, EMBEDDING_MODEL, TOP_K, OPENAI_API_KEY
+from backend.config import CHUNK_TOKENS, CHUNK_OVERLAP_TOKENS
+from backend.config import EMBED_BATCH_SIZE, EMBED_WORKERS, EMBED_CACHE, RETRIEVAL_MODE, RRF_K, LEXICAL_EXACT
+from backend.config import VECTOR_BACKEND
+from backend.lexical import LexicalIndex, rrf_fuse
+from backend.quantized import QuantizedIndex, chroma_fetch
+from backend.chunker import chunk_text, iter_chunks
+from backend.metrics import inc, span, traced
 
 
 # ---- Embedding function ----
@@ -35,86 +40,502 @@ def get_embedder():
 
         return _embed, "openai-text-embedding-3-small"
     else:
+        # imported here so that importing this module does not pull in chromadb and torch
+        from chromadb.utils import embedding_functions
         return embedding_functions.SentenceTransformerEmbeddingFunction(
             model_name=EMBEDDING_MODEL
         ), EMBEDDING_MODEL
 
 
+# ---- Retrieval service ----
+class RetrievalService:
+    """Process-wide Chroma client, collection and embedder, opened once.
+
+    Initialisation is guarded by a lock so concurrent Streamlit sessions share
+    one instance; queries embed the text themselves and pass
+    `query_embeddings`, so the same embedder is used for indexing and search.
+    An `(embed_fn, name)` pair can be passed to use a specific embedder
+    instead of get_embedder(); it is used as is, without the embedding cache.
+    """
+
+    def __init__(self, chroma_dir: str = CHROMA_DIR, collection: str = "docs", embedder=None):
+        self.chroma_dir = str(chroma_dir)
+        self.collection_name = collection
+        self._lock = threading.RLock()
+        self._client = None
+        self._collection = None
+        self._embedder, self.embed_name = embedder if embedder else (None, None)
+        self._lexical = None
+        self._quantized = {}
+
+    @property
+    def client(self):
+        if self._client is None:
+            with self._lock:
+                if self._client is None:
+                    from chromadb import PersistentClient
+                    self._client = PersistentClient(path=self.chroma_dir)
+        return self._client
+
+    @property
+    def collection(self):
+        if self._collection is None:
+            with self._lock:
+                if self._collection is None:
+                    self._collection = self.client.get_or_create_collection(self.collection_name)
+        return self._collection
+
+    @property
+    def embedder(self):
+        if self._embedder is None:
+            with self._lock:
+                if self._embedder is None:
+                    embedder, self.embed_name = get_embedder()
+                    if EMBED_CACHE:
+                        from backend.embed_cache import CachedEmbedder, get_embedding_cache
+                        embedder = CachedEmbedder(embedder, self.embed_name, get_embedding_cache())
+                    self._embedder = embedder
+        return self._embedder
+
+    @property
+    def lexical(self) -> Optional[LexicalIndex]:
+        """BM25 index written by build_index(), or None if there is none yet."""
+        if self._lexical is None:
+            with self._lock:
+                if self._lexical is None:
+                    self._lexical = LexicalIndex.load(lexical_path(self))
+        return self._lexical
+
+    def quantized(self, kind: str = VECTOR_BACKEND) -> Optional[QuantizedIndex]:
+        """int8 or pq index written by build_index(), or None for "chroma" or if there is none yet."""
+        if kind == "chroma":
+            return None
+        if kind not in self._quantized:
+            with self._lock:
+                if kind not in self._quantized:
+                    # a missing index is remembered too, so queries do not retry the load
+                    index = QuantizedIndex.load(self.chroma_dir, self.collection_name, kind)
+                    self._quantized[kind] = index if index is not None else False
+        index = self._quantized[kind]
+        return index if index is not False else None
+
+    def set_lexical(self, index: Optional[LexicalIndex]):
+        with self._lock:
+            if index is not None:
+                index.save(lexical_path(self))
+            self._lexical = index
+
+    def embed(self, texts: List[str]) -> List[List[float]]:
+        texts = list(texts)
+        with span("embed"):
+            inc("embedded_texts", len(texts))
+            return np.asarray(self.embedder(texts), dtype=np.float32).tolist()
+
+    def drop_collection(self):
+        with self._lock:
+            try:
+                self.client.delete_collection(self.collection_name)
+                print(f"Cleared existing '{self.collection_name}' collection.")
+            except Exception:
+                pass
+            self._collection = None
+            self._lexical = None
+            lexical_path(self).unlink(missing_ok=True)
+            for kind in ("int8", "pq"):
+                QuantizedIndex.remove(self.chroma_dir, self.collection_name, kind)
+            self._quantized = {}
+
+    def warm(self):
+        self.collection
+        self.lexical
+        self.quantized()
+        # run the model itself: through the embedding cache a repeat warm-up would be a cache hit
+        embedder = self.embedder
+        getattr(embedder, "embed_fn", embedder)(["warm-up"])
+
+
+_service: Optional[RetrievalService] = None
+_service_lock = threading.Lock()
+
+
+def get_service() -> RetrievalService:
+    global _service
+    with _service_lock:
+        if _service is None:
+            _service = RetrievalService()
+        return _service
+
+
+def get_chroma_client():
+    return get_service().client
+
+
 # ---- Text chunking ----
-def chunk_text(text: str, size: int = CHUNK_SIZE, overlap: int = CHUNK_OVERLAP) -> List[str]:
-    paras = [p.strip() for p in re.split(r'\n\s*\n+', text) if p.strip()]
-    chunks = []
-    for p in paras:
-        if len(p) <= size:
-            chunks.append(p)
-        else:
-            for i in range(0, len(p), size - overlap):
-                chunks.append(p[i:i+size])
-    return chunks if chunks else [text[:size]]
+# recorded in the manifest; changing the chunker or its sizes rebuilds the collection
+CHUNKER = f"sentences-v1:{CHUNK_TOKENS}:{CHUNK_OVERLAP_TOKENS}"
+
+
+# ---- Index manifest ----
+def _sha(data: bytes) -> str:
+    return hashlib.sha256(data).hexdigest()
+
+
+def _equipment_for(p: Path) -> str:
+    return "hvac" if "hvac" in p.stem.lower() else "chiller" if "chiller" in p.stem.lower() else "building"
+
+
+def manifest_path(service: RetrievalService) -> Path:
+    return Path(service.chroma_dir) / f"{service.collection_name}_manifest.json"
+
+
+def lexical_path(service: RetrievalService) -> Path:
+    return Path(service.chroma_dir) / f"{service.collection_name}_lexical.npz"
+
+
+def load_manifest(service: RetrievalService) -> dict:
+    try:
+        return json.loads(manifest_path(service).read_text(encoding="utf-8"))
+    except (OSError, ValueError):
+        return {}
+
+
+def save_manifest(service: RetrievalService, manifest: dict):
+    path = manifest_path(service)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_suffix(".tmp")
+    tmp.write_text(json.dumps(manifest, indent=1), encoding="utf-8")
+    os.replace(tmp, path)
 
 
 # ---- Build index ----
-def build_index(clear: bool = False):
-    client = get_chroma_client()
+def _file_sha(path: Path) -> str:
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            h.update(block)
+    return h.hexdigest()
 
-    if clear:
-        try:
-            client.delete_collection("docs")
-            print("Cleared existing 'docs' collection.")
-        except Exception:
-            pass
 
-    embedder, embed_name = get_embedder()
-    docs, ids, metadatas = [], [], []
+def _scan_docs(docs_dir: Path, files: dict, embed_name: str, batch_size: int, stats: dict):
+    """Lazily walks `docs_dir` and yields the index operations needed per file.
 
-    for fp in glob.glob(str(DOCS_DIR / "*.txt")):
+    Yields ("delete", ids), ("update", (ids, metadatas)), ("add", (ids, docs,
+    metadatas)) in batches of at most `batch_size`, then ("done", (name, record))
+    once everything for that file has been emitted.
+    """
+    for fp in sorted(glob.glob(str(Path(docs_dir) / "*.txt"))):
         p = Path(fp)
-        raw = p.read_text(encoding="utf-8", errors="ignore")
-        chunks = chunk_text(raw)
-        equip = "hvac" if "hvac" in p.stem.lower() else "chiller" if "chiller" in p.stem.lower() else "building"
-
-        for i, ch in enumerate(chunks):
-            docs.append(ch)
-            ids.append(f"{p.stem}-{i}")
-            metadatas.append({
-                "source": p.name,
-                "equipment": equip,
-                "chunk": i,
-                "embedder": embed_name
-            })
-
-    if not docs:
-        print("No docs found to index.")
-        return
+        stats["seen"].add(p.name)
+        file_sha = _file_sha(p)
+        record = files.get(p.name, {})
+        old = record.get("chunks", {})
+        if record.get("sha") == file_sha:
+            stats["unchanged"] += len(old)
+            continue
 
-    if callable(embedder):  # OpenAI embeddings path
-        coll = client.get_or_create_collection("docs")
-        embeddings = embedder(docs)
-        coll.add(documents=docs, metadatas=metadatas, ids=ids, embeddings=embeddings)
-    else:  # SentenceTransformers path
-        coll = client.get_or_create_collection("docs", embedding_function=embedder)
-        coll.add(documents=docs, metadatas=metadatas, ids=ids)
+        equip = _equipment_for(p)
+        new_chunks = {}
+        adds, moves = ([], [], []), ([], [])
+        for i, ch in enumerate(iter_chunks(str(p))):
+            cid = f"{p.stem}-{_sha(ch.text.encode('utf-8'))[:16]}"
+            n = 1
+            while cid in new_chunks:  # identical chunks repeated in one file
+                cid = f"{cid.rsplit('~', 1)[0]}~{n}"
+                n += 1
+            new_chunks[cid] = [i, ch.start, ch.end]
+            meta = {"source": p.name, "equipment": equip, "chunk": i, "char_start": ch.start,
+                    "char_end": ch.end, "tokens": ch.tokens, "embedder": embed_name}
+            if cid not in old:
+                adds[0].append(cid); adds[1].append(ch.text); adds[2].append(meta)
+                if len(adds[0]) >= batch_size:
+                    yield "add", adds
+                    adds = ([], [], [])
+            elif old[cid] != new_chunks[cid]:
+                moves[0].append(cid); moves[1].append(meta)
+            else:
+                stats["unchanged"] += 1
 
-    print(f"Indexed {len(docs)} chunks into Chroma.")
+        stale = [cid for cid in old if cid not in new_chunks]
+        if stale:
+            yield "delete", stale
+        if moves[0]:
+            yield "update", moves
+        if adds[0]:
+            yield "add", adds
+        yield "done", (p.name, {"sha": file_sha, "chunks": new_chunks})
 
 
-# ---- Retrieve docs ----
-def retrieve(query: str, equipment: Optional[str] = None, k: int = TOP_K):
-    client = get_chroma_client()
-    coll = client.get_or_create_collection("docs")
-    where = {"equipment": equipment} if equipment else None
+def _pages(coll, include: List[str], page: int = 2000):
+    """Yields coll.get() results `page` rows at a time, so a full pass never holds the whole collection."""
+    offset = 0
+    while True:
+        got = coll.get(include=include, limit=page, offset=offset)
+        if not got["ids"]:
+            return
+        yield got
+        offset += len(got["ids"])
+
+
+def _rebuild_lexical(coll) -> LexicalIndex:
+    """BM25 index over the whole collection, streaming the chunk texts page by page."""
+    ids, metadatas = [], []
+    for got in _pages(coll, ["metadatas"]):
+        ids += got["ids"]
+        metadatas += [{"equipment": (md or {}).get("equipment")} for md in got["metadatas"]]
+
+    def texts():
+        seen = 0
+        for got in _pages(coll, ["documents"]):
+            if got["ids"] != ids[seen:seen + len(got["ids"])]:
+                raise RuntimeError("collection changed while rebuilding the lexical index")
+            seen += len(got["ids"])
+            yield from got["documents"]
+
+    return LexicalIndex.build(ids, texts(), metadatas)
+
+
+def _refit_quantized(service: RetrievalService, coll) -> QuantizedIndex:
+    """Fits a new quantized index on every vector in the collection, read page by page into one matrix."""
+    ids, metadatas, X = [], [], None
+    for got in _pages(coll, ["metadatas", "embeddings"]):
+        emb = np.asarray(got["embeddings"], dtype=np.float32)
+        if X is None:
+            X = np.empty((coll.count(), emb.shape[1]), dtype=np.float32)
+        X[len(ids):len(ids) + len(emb)] = emb
+        ids += got["ids"]
+        metadatas += got["metadatas"]
+    X = X[:len(ids)] if X is not None else np.zeros((0, 0), dtype=np.float32)
+    return QuantizedIndex.build(service.chroma_dir, service.collection_name, VECTOR_BACKEND, ids, X, metadatas)
+
+
+@traced()
+def build_index(clear: bool = False, service: Optional[RetrievalService] = None, docs_dir: Path = DOCS_DIR,
+                batch_size: int = EMBED_BATCH_SIZE, workers: int = EMBED_WORKERS, progress: bool = True):
+    """Incrementally syncs the collection with the files in `docs_dir`.
 
-    res = coll.query(query_texts=[query], n_results=k, where=where)
+    Files and chunks are content-hashed and recorded in a manifest next to the
+    Chroma store; only new chunks are embedded, moved chunks get a metadata
+    update and chunks that disappeared are deleted. Files are read and chunked
+    lazily, embedded in batches on a worker pool and written in submission
+    order with a bounded number of batches in flight. The manifest is saved as
+    files complete, so an interrupted run resumes where it stopped.
+    """
+    from tqdm import tqdm
+
+    service = service or get_service()
+    service.embedder  # loads the model and sets embed_name
+
+    manifest = {} if clear else load_manifest(service)
+    if clear or manifest.get("embedder") != service.embed_name or manifest.get("chunker") != CHUNKER:
+        service.drop_collection()
+        manifest = {}
+    files = manifest.setdefault("files", {})
+    manifest["embedder"] = service.embed_name
+    manifest["chunker"] = CHUNKER
+
+    coll = service.collection
+    stats = {"added": 0, "updated": 0, "deleted": 0, "unchanged": 0, "seen": set()}
+    # changes for an existing quantized index, applied with its current codebooks at the end
+    qindex = service.quantized() if VECTOR_BACKEND != "chroma" else None
+    delta = {"added": ([], [], []), "deleted": [], "updated": ([], [])} if qindex is not None else None
+    pending = deque()
+    last_save = time.monotonic()
+    bar = tqdm(unit="chunk", desc="Embedding", disable=not progress)
+
+    def drain(limit: int):
+        nonlocal last_save
+        while len(pending) > limit:
+            kind, payload, fut = pending.popleft()
+            if kind == "add":
+                ids, docs, metadatas = payload
+                embeddings = fut.result()
+                with span("chroma.upsert"):
+                    coll.upsert(documents=docs, metadatas=metadatas, ids=ids, embeddings=embeddings)
+                if delta is not None:
+                    for acc, part in zip(delta["added"], (ids, embeddings, metadatas)):
+                        acc.extend(part)
+                stats["added"] += len(ids)
+                bar.update(len(ids))
+            else:
+                name, record = payload
+                files[name] = record
+                if time.monotonic() - last_save > 2.0:
+                    save_manifest(service, manifest)
+                    last_save = time.monotonic()
+
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+        for kind, payload in _scan_docs(docs_dir, files, service.embed_name, batch_size, stats):
+            if kind == "delete":
+                coll.delete(ids=payload)
+                stats["deleted"] += len(payload)
+                if delta is not None:
+                    delta["deleted"].extend(payload)
+            elif kind == "update":
+                coll.update(ids=payload[0], metadatas=payload[1])
+                stats["updated"] += len(payload[0])
+                if delta is not None:
+                    delta["updated"][0].extend(payload[0])
+                    delta["updated"][1].extend(payload[1])
+            elif kind == "add":
+                pending.append((kind, payload, pool.submit(service.embed, payload[1])))
+            else:
+                pending.append((kind, payload, None))
+            drain(2 * max(1, workers))
+        drain(0)
+    bar.close()
+
+    for name in [n for n in files if n not in stats["seen"]]:
+        stale = list(files.pop(name).get("chunks", {}))
+        if stale:
+            coll.delete(ids=stale)
+            if delta is not None:
+                delta["deleted"].extend(stale)
+        stats["deleted"] += len(stale)
+
+    save_manifest(service, manifest)
+    changed = stats["added"] or stats["updated"] or stats["deleted"]
+    if changed or service.lexical is None:
+        # the postings are rebuilt from the collection rather than patched; the texts are streamed
+        service.set_lexical(_rebuild_lexical(coll))
+    if VECTOR_BACKEND != "chroma":
+        with span("quantize"):
+            if qindex is not None and changed:
+                qindex = qindex.update(service.chroma_dir, service.collection_name, delta["added"],
+                                       delta["deleted"], delta["updated"])
+            # full fit on a first build, after enough growth, or if an interrupted run left it behind
+            if qindex is None or qindex.needs_retrain or len(qindex) != coll.count():
+                qindex = _refit_quantized(service, coll)
+        service._quantized[VECTOR_BACKEND] = qindex
+    if not files:
+        print("No docs found to index.")
+        return
+    print(f"Indexed {stats['added']} new chunks into Chroma "
+          f"({stats['updated']} moved, {stats['deleted']} deleted, {stats['unchanged']} unchanged).")
+
+
+# ---- Retrieve docs ----
+def _hits(res, qi: int):
     out = []
-    for i in range(len(res["ids"][0])):
+    for i in range(len(res["ids"][qi])):
         out.append({
-            "id": res["ids"][0][i],
-            "text": res["documents"][0][i],
-            "metadata": res["metadatas"][0][i],
-            "dist": res.get("distances", [[None]])[0][i] if res.get("distances") else None
+            "id": res["ids"][qi][i],
+            "text": res["documents"][qi][i],
+            "metadata": res["metadatas"][qi][i],
+            "dist": res["distances"][qi][i] if res.get("distances") else None
         })
     return out
 
 
+def _fetch(service: RetrievalService, ids: List[str]) -> dict:
+    if not ids:
+        return {}
+    got = service.collection.get(ids=list(ids), include=["documents", "metadatas"])
+    return {i: {"id": i, "text": d, "metadata": m, "dist": None}
+            for i, d, m in zip(got["ids"], got["documents"], got["metadatas"])}
+
+
+@traced("retrieve")
+def retrieve_many(queries: List[str], equipment=None, k: int = TOP_K,
+                  service: Optional[RetrievalService] = None, mode: str = RETRIEVAL_MODE,
+                  backend: str = VECTOR_BACKEND) -> List[List[dict]]:
+    """Retrieves for many queries with one embedding batch.
+
+    `equipment` is either one filter for all queries or a list with one filter
+    (or None) per query; queries sharing a filter go to Chroma in one call.
+
+    `mode` is "dense", "lexical" or "hybrid". Hybrid runs the BM25 leg and the
+    vector leg and merges them with reciprocal rank fusion; for queries naming
+    device IDs or fault codes, the chunks containing all of them are fused in
+    as a third ranking. Without a lexical index every mode falls back to dense
+    search.
+
+    `backend` picks the vector leg: "chroma", or the memory-mapped "int8" or
+    "pq" index when build_index() has written one (Chroma otherwise).
+    """
+    service = service or get_service()
+    queries = list(queries)
+    if not queries:
+        return []
+    filters = list(equipment) if isinstance(equipment, (list, tuple)) else [equipment] * len(queries)
+    if len(filters) != len(queries):
+        raise ValueError("equipment must be a single filter or one per query")
+
+    # identical (query, filter) pairs are only embedded and searched once
+    unique = {}
+    for q, f in zip(queries, filters):
+        unique.setdefault((q, f or None), len(unique))
+    keys = list(unique)
+
+    lex = service.lexical if mode in ("hybrid", "lexical") else None
+    depth = k if lex is None else max(2 * k, 10)
+    lexical = [None] * len(keys)
+    exact = [[] for _ in keys]
+    results = [None] * len(keys)
+    if lex is not None:
+        for u, (q, f) in enumerate(keys):
+            inc("lexical_queries")
+            if mode == "lexical":
+                results[u] = lex.search(q, k, f)
+                continue
+            lexical[u] = [doc_id for doc_id, _ in lex.search(q, depth, f)]
+            if LEXICAL_EXACT:
+                exact[u] = [doc_id for doc_id, _ in lex.exact(q, depth, f)]
+                if exact[u]:
+                    inc("lexical_exact_matches")
+
+    dense = [None] * len(keys)
+    quantized = service.quantized(backend)
+    todo = [u for u in range(len(keys)) if results[u] is None]
+    if todo:
+        embeddings = service.embed([keys[u][0] for u in todo])
+        groups = {}
+        for u, emb in zip(todo, embeddings):
+            groups.setdefault(keys[u][1], []).append((u, emb))
+        for f, items in groups.items():
+            if quantized is not None:
+                with span("quantized.search"):
+                    found = quantized.search([emb for _, emb in items], depth, f,
+                                             fetch=chroma_fetch(service.collection))
+                for j, (u, _) in enumerate(items):
+                    dense[u] = [{"id": doc_id, "dist": dist} for doc_id, dist in found[j]]
+                continue
+            with span("chroma.query"):
+                res = service.collection.query(query_embeddings=[emb for _, emb in items], n_results=depth,
+                                               where={"equipment": f} if f else None)
+            for j, (u, _) in enumerate(items):
+                dense[u] = _hits(res, j)
+
+    # lexical-only hits still need their text and metadata, fetched by ID in one call
+    # (quantized hits only carry id and distance, so they are fetched the same way)
+    known = {h["id"]: h for hits in dense if hits for h in hits if "text" in h}
+    wanted = {doc_id for r in results if r for doc_id, _ in r}
+    wanted |= {doc_id for ranking in lexical if ranking for doc_id in ranking}
+    wanted |= {doc_id for ranking in exact for doc_id in ranking}
+    wanted |= {h["id"] for hits in dense if hits for h in hits}
+    known.update(_fetch(service, [i for i in wanted if i not in known]))
+    if quantized is not None:
+        dense = [[{**known[h["id"]], "dist": h["dist"]} for h in hits if h["id"] in known] if hits else hits
+                 for hits in dense]
+
+    for u in range(len(keys)):
+        if results[u] is not None:
+            ranked = results[u]
+        elif lexical[u] is None:
+            results[u] = dense[u][:k]
+            continue
+        else:
+            rankings = [[h["id"] for h in dense[u]], lexical[u]]
+            if exact[u]:
+                rankings.append(exact[u])
+            ranked = rrf_fuse(rankings, k, RRF_K)
+        results[u] = [{**known[i], "score": s} for i, s in ranked if i in known]
+    return [results[unique[(q, f or None)]] for q, f in zip(queries, filters)]
+
+
+def retrieve(query: str, equipment: Optional[str] = None, k: int = TOP_K,
+             service: Optional[RetrievalService] = None, mode: str = RETRIEVAL_MODE, backend: str = VECTOR_BACKEND):
+    return retrieve_many([query], equipment, k, service, mode, backend)[0]
+
+
 if __name__ == "__main__":
-    build_index(clear=True)
\ No newline at end of file
+    build_index(clear="--clear" in sys.argv)
@@ -0,0 +1,180 @@
+import threading
+from typing import Dict, List, Optional
+
+import numpy as np
+import pandas as pd
+
+METRICS = ["temp_c", "vibration", "power_kw"]
+RESOLUTIONS = {"1min": 60, "15min": 900, "1h": 3600}
+# buckets kept per device and resolution: 2 days of minutes, 30 days of 15 min, 1 year of hours
+RETENTION = {"1min": 2 * 1440, "15min": 30 * 96, "1h": 365 * 24}
+
+
+class RollupStore:
+    """Per-device min/mean/max rollups at several resolutions, updated incrementally.
+
+    Each resolution keeps count, sum, min and max per (device_id, bucket). An
+    update aggregates only the new rows and merges them into the buckets at or
+    after the oldest bucket they touch; older buckets are left alone.
+    """
+
+    def __init__(self, metrics: List[str] = METRICS, resolutions: Dict[str, int] = RESOLUTIONS,
+                 retention: Dict[str, int] = RETENTION):
+        self.metrics = list(metrics)
+        self.resolutions = dict(resolutions)
+        self.retention = dict(retention)
+        self._state: Dict[str, pd.DataFrame] = {r: pd.DataFrame() for r in self.resolutions}
+        self._lock = threading.Lock()
+
+    def _aggregate(self, df: pd.DataFrame, seconds: int) -> pd.DataFrame:
+        ts = pd.to_datetime(df["timestamp"]).to_numpy().astype("datetime64[s]").astype(np.int64)
+        keys = [df["device_id"].to_numpy(), ts // seconds * seconds]
+        vals = df[self.metrics].astype(float)
+        g = vals.groupby(keys)
+        out = pd.concat([g.size().rename("count"),
+                         g.sum(min_count=1).add_suffix("_sum"),
+                         g.min().add_suffix("_min"),
+                         g.max().add_suffix("_max")], axis=1)
+        out.index.names = ["device_id", "bucket"]
+        return out
+
+    def _merge(self, parts: List[pd.DataFrame]) -> pd.DataFrame:
+        both = pd.concat(parts)
+        g = both.groupby(level=["device_id", "bucket"])
+        agg = {"count": "sum"}
+        for m in self.metrics:
+            agg.update({f"{m}_sum": "sum", f"{m}_min": "min", f"{m}_max": "max"})
+        return g.agg(agg)
+
+    def update(self, df: pd.DataFrame):
+        if df is None or len(df) == 0:
+            return
+        with self._lock:
+            for res, seconds in self.resolutions.items():
+                new = self._aggregate(df, seconds)
+                state = self._state[res]
+                if state.empty:
+                    merged = new
+                else:
+                    lo = new.index.get_level_values("bucket").min()
+                    hot = state.index.get_level_values("bucket") >= lo
+                    merged = pd.concat([state[~hot], self._merge([state[hot], new])]) if hot.any() \
+                        else pd.concat([state, new])
+                keep = self.retention.get(res)
+                if keep:
+                    newest = merged.index.get_level_values("bucket").max()
+                    merged = merged[merged.index.get_level_values("bucket") > newest - keep * seconds]
+                self._state[res] = merged
+
+    def _frame(self, resolution: str, device_id: Optional[str] = None, start=None, end=None) -> pd.DataFrame:
+        with self._lock:
+            state = self._state[resolution]
+        df = state.reset_index()
+        if df.empty:
+            return df
+        step = self.resolutions[resolution]
+        if device_id is not None:
+            df = df[df["device_id"] == device_id]
+        if start is not None:
+            df = df[df["bucket"] >= pd.Timestamp(start).value // 10**9 // step * step]
+        if end is not None:
+            df = df[df["bucket"] < pd.Timestamp(end).value // 10**9]
+        return df
+
+    def _finish(self, df: pd.DataFrame, by: List[str]) -> pd.DataFrame:
+        for m in self.metrics:
+            df[f"{m}_mean"] = df.pop(f"{m}_sum") / df["count"]
+        df.insert(0, "timestamp", pd.to_datetime(df.pop("bucket"), unit="s"))
+        cols = ["timestamp"] + by + ["count"] + [f"{m}_{s}" for m in self.metrics for s in ("min", "mean", "max")]
+        return df[cols].sort_values(["timestamp"] + by).reset_index(drop=True)
+
+    def get(self, resolution: str, device_id: Optional[str] = None, start=None, end=None) -> pd.DataFrame:
+        """Returns timestamp, device_id, count and <metric>_min/_mean/_max rows."""
+        df = self._frame(resolution, device_id, start, end)
+        if df.empty:
+            return pd.DataFrame(columns=["timestamp", "device_id", "count"])
+        return self._finish(df, ["device_id"])
+
+    def fleet(self, resolution: str, start=None, end=None) -> pd.DataFrame:
+        """Count-weighted mean and overall min/max across all devices per bucket."""
+        df = self._frame(resolution, start=start, end=end)
+        if df.empty:
+            return pd.DataFrame(columns=["timestamp", "count"])
+        agg = {"count": "sum"}
+        for m in self.metrics:
+            agg.update({f"{m}_sum": "sum", f"{m}_min": "min", f"{m}_max": "max"})
+        return self._finish(df.groupby("bucket").agg(agg).reset_index(), [])
+
+    def latest(self) -> Optional[pd.Timestamp]:
+        with self._lock:
+            state = self._state[min(self.resolutions, key=self.resolutions.get)]
+        if state.empty:
+            return None
+        return pd.to_datetime(state.index.get_level_values("bucket").max(), unit="s")
+
+    def pick_resolution(self, seconds: float, max_points: int) -> str:
+        """Finest resolution that covers `seconds` in at most `max_points` buckets."""
+        for res, step in sorted(self.resolutions.items(), key=lambda kv: kv[1]):
+            if seconds / step <= max_points:
+                return res
+        return max(self.resolutions, key=self.resolutions.get)
+
+
+# ---- Downsampling ----
+def lttb(x: np.ndarray, y: np.ndarray, n_out: int) -> np.ndarray:
+    """Largest-Triangle-Three-Buckets; returns the indices of the points to keep."""
+    n = len(x)
+    if n_out >= n or n_out < 3:
+        return np.arange(n)
+    x = np.asarray(x, dtype=float)
+    x = x - x[0]
+    y = np.asarray(y, dtype=float)
+    edges = np.linspace(1, n - 1, n_out - 1).astype(np.int64)
+    keep = np.empty(n_out, dtype=np.int64)
+    keep[0], keep[-1] = 0, n - 1
+    a = 0
+    for i in range(n_out - 2):
+        lo, hi = edges[i], edges[i + 1]
+        nxt_lo, nxt_hi = edges[i + 1], (edges[i + 2] if i + 2 < len(edges) else n)
+        cx = x[nxt_lo:nxt_hi].mean()
+        cy = y[nxt_lo:nxt_hi].mean()
+        xs, ys = x[lo:hi], y[lo:hi]
+        area = np.abs((x[a] - cx) * (ys - y[a]) - (x[a] - xs) * (cy - y[a]))
+        a = lo + int(np.nanargmax(area)) if len(area) and not np.isnan(area).all() else lo
+        keep[i + 1] = a
+    return keep
+
+
+def downsample(df: pd.DataFrame, x: str, columns: List[str], max_points: int = 2000) -> pd.DataFrame:
+    """LTTB-downsamples each column independently and returns a long frame (x, signal, value)."""
+    if len(df) == 0:
+        return pd.DataFrame(columns=[x, "signal", "value"])
+    xs = pd.to_datetime(df[x]).to_numpy().astype("datetime64[ns]").astype(np.int64)
+    out = []
+    for c in columns:
+        y = df[c].to_numpy(dtype=float)
+        idx = lttb(xs, np.nan_to_num(y, nan=np.nanmean(y) if np.isfinite(y).any() else 0.0), max_points)
+        out.append(pd.DataFrame({x: df[x].to_numpy()[idx], "signal": c, "value": y[idx]}))
+    return pd.concat(out, ignore_index=True)
+
+
+def chart_frame(raw: Optional[pd.DataFrame], rollups: Optional[RollupStore], seconds: float,
+                metrics: List[str] = METRICS, max_points: int = 2000) -> pd.DataFrame:
+    """Picks raw rows or the finest rollup covering the window, then downsamples with LTTB.
+
+    The result has at most `max_points` points per signal whatever the window.
+    """
+    end = None
+    if raw is not None and len(raw):
+        end = pd.Timestamp(raw["timestamp"].max())
+    elif rollups is not None:
+        end = rollups.latest()
+    if end is None:
+        return pd.DataFrame(columns=["timestamp", "signal", "value"])
+    start = end - pd.Timedelta(seconds=seconds)
+    if raw is not None and len(raw) and (rollups is None or raw["timestamp"].min() <= start):
+        src = raw[raw["timestamp"] >= start]
+    else:
+        res = rollups.pick_resolution(seconds, max_points)
+        src = rollups.fleet(res, start=start).rename(columns={f"{m}_mean": m for m in metrics})
+    return downsample(src, "timestamp", metrics, max_points)
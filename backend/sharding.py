@@ -0,0 +1,234 @@
+import sys
+import pathlib
+sys.path.append(str(pathlib.Path(__file__).resolve().parent.parent))
+
+import argparse
+import time
+from concurrent.futures import Executor, ProcessPoolExecutor
+from multiprocessing import resource_tracker, shared_memory
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+import pandas as pd
+
+from backend.config import MODEL_DIR, SHARD_WORKERS
+from backend.metrics import traced
+
+Task = Tuple[str, int, int]  # device_id, first row, end row (in device-sorted order)
+
+
+def _attach(name: str) -> shared_memory.SharedMemory:
+    """Opens an existing block without registering it with this process's resource tracker.
+
+    Before Python 3.13 attaching registers the block too. A pool worker forked
+    before the block existed runs its own tracker, which would then unlink the
+    block or report it as leaked when the worker exits. Only the creator
+    tracks and unlinks it.
+    """
+    try:
+        return shared_memory.SharedMemory(name=name, track=False)
+    except TypeError:
+        pass
+    register = resource_tracker.register
+    resource_tracker.register = lambda name, rtype: None
+    try:
+        return shared_memory.SharedMemory(name=name)
+    finally:
+        resource_tracker.register = register
+
+
+class SharedArray:
+    """A NumPy array in a named shared-memory block; workers attach by name without copying."""
+
+    def __init__(self, shape: Tuple[int, ...], dtype=np.float64, name: Optional[str] = None):
+        self.shape, self.dtype = tuple(shape), np.dtype(dtype)
+        nbytes = max(1, int(np.prod(self.shape)) * self.dtype.itemsize)
+        self.owner = name is None
+        self.shm = shared_memory.SharedMemory(create=True, size=nbytes) if self.owner else _attach(name)
+        self.array = np.ndarray(self.shape, dtype=self.dtype, buffer=self.shm.buf)
+
+    @property
+    def handle(self) -> tuple:
+        return self.shm.name, self.shape, self.dtype.str
+
+    @classmethod
+    def attach(cls, handle: tuple) -> "SharedArray":
+        name, shape, dtype = handle
+        return cls(shape, dtype, name=name)
+
+    def close(self):
+        # only the owner unlinks; attached copies just close their mapping
+        self.array = None
+        self.shm.close()
+        if self.owner:
+            self.shm.unlink()
+
+
+def pack(df: pd.DataFrame, feature_cols: Sequence[str]) -> Tuple[np.ndarray, np.ndarray, List[Task]]:
+    """Groups rows by device into one float64 matrix.
+
+    Returns the matrix (rows sorted by device, original order kept within a
+    device), the permutation `order` with `X[i] == features[order[i]]` and
+    one (device, lo, hi) task per device. Features are forward-filled within
+    each device and NaNs set to 0, as train_anomaly_model() does per device.
+    """
+    devices = df["device_id"].astype(str).to_numpy()
+    order = np.argsort(devices, kind="stable")
+    feats = df[list(feature_cols)].astype(float)
+    feats = feats.groupby(devices, sort=False).ffill().fillna(0.0)
+    X = np.ascontiguousarray(feats.to_numpy()[order])
+    sorted_dev = devices[order]
+    starts = np.flatnonzero(np.r_[True, sorted_dev[1:] != sorted_dev[:-1]]) if len(sorted_dev) else np.array([], int)
+    ends = np.r_[starts[1:], len(sorted_dev)]
+    tasks = [(sorted_dev[lo], int(lo), int(hi)) for lo, hi in zip(starts, ends)]
+    return X, order, tasks
+
+
+def shard(tasks: List[Task], n_shards: int) -> List[List[Task]]:
+    """Splits device tasks into `n_shards` lists of roughly equal row counts (largest first)."""
+    shards = [[] for _ in range(max(1, n_shards))]
+    load = [0] * len(shards)
+    for task in sorted(tasks, key=lambda t: t[1] - t[2]):
+        i = load.index(min(load))
+        shards[i].append(task)
+        load[i] += task[2] - task[1]
+    return [s for s in shards if s]
+
+
+# ---- Worker side (top-level so the process pool can import them) ----
+_registries: Dict[str, object] = {}
+
+
+def _worker_registry(root: str):
+    from backend.model_registry import ModelRegistry
+    reg = _registries.get(root)
+    if reg is None:
+        reg = _registries[root] = ModelRegistry(root)
+    return reg
+
+
+def _process(X: np.ndarray, out: Optional[np.ndarray], tasks: List[Task], feature_cols: List[str], registry,
+             window: Optional[int], force: bool, train: bool) -> List[tuple]:
+    from backend.models import score_anomalies
+    done = []
+    for dev, lo, hi in tasks:
+        frame = pd.DataFrame(X[lo:hi], columns=feature_cols, copy=False)
+        key = registry.key(feature_cols, dev, window or len(frame))
+        model = registry.get(key)
+        trained = False
+        if train and (force or registry.needs_retrain(model, frame)):
+            model = registry.get_or_train(frame, device=dev, feature_cols=feature_cols, window=window, force=True)
+            trained = True
+        if out is not None:
+            out[lo:hi] = score_anomalies(model, frame) if model is not None else np.nan
+        done.append((dev, key, trained, hi - lo))
+    return done
+
+
+def _run_shard(x_handle: tuple, out_handle: Optional[tuple], tasks: List[Task], feature_cols: List[str],
+               registry_root: str, window: Optional[int], force: bool, train: bool) -> List[tuple]:
+    X = SharedArray.attach(x_handle)
+    out = SharedArray.attach(out_handle) if out_handle else None
+    try:
+        return _process(X.array, out.array if out else None, tasks, feature_cols,
+                        _worker_registry(registry_root), window, force, train)
+    finally:
+        X.close()
+        if out is not None:
+            out.close()
+
+
+def _run(df: pd.DataFrame, feature_cols: Sequence[str], window: Optional[int], registry, workers: Optional[int],
+         pool: Optional[Executor], force: bool, train: bool, score: bool):
+    from backend.model_registry import get_registry
+    registry = registry or get_registry()
+    feature_cols = list(feature_cols)
+    X, order, tasks = pack(df, feature_cols)
+    workers = workers or SHARD_WORKERS
+    if workers <= 1 or len(tasks) <= 1:
+        out = np.empty(len(X)) if score else None
+        done = _process(X, out, tasks, feature_cols, registry, window, force, train)
+        return done, (out, order)
+
+    shm_x = SharedArray(X.shape)
+    shm_out = SharedArray((len(X),)) if score else None
+    try:
+        shm_x.array[:] = X
+        del X
+        # a few shards per worker so one big device does not leave the others idle
+        shards = shard(tasks, workers * 4)
+        own = pool is None
+        pool = pool or ProcessPoolExecutor(max_workers=workers)
+        try:
+            futures = [pool.submit(_run_shard, shm_x.handle, shm_out.handle if shm_out else None, s, feature_cols,
+                                   registry.root, window, force, train) for s in shards]
+            done = [row for f in futures for row in f.result()]
+        finally:
+            if own:
+                pool.shutdown()
+        out = shm_out.array.copy() if shm_out else None
+    finally:
+        shm_x.close()
+        if shm_out:
+            shm_out.close()
+    # models fitted in the workers are on disk; drop any stale copy held by this process
+    registry.evict([key for _, key, trained, _ in done if trained])
+    return done, (out, order)
+
+
+@traced()
+def train_fleet(df: pd.DataFrame, feature_cols: Sequence[str], window: Optional[int] = None, registry=None,
+                workers: Optional[int] = None, pool: Optional[Executor] = None, force: bool = False) -> pd.DataFrame:
+    """Trains (or refreshes) one model per device across `workers` processes (or the given pool).
+
+    Each worker attaches to the shared feature matrix, fits the devices of its
+    shard with the registry's retrain rules and saves the models to the
+    registry directory. Returns one row per device: device_id, key, trained,
+    n_rows.
+    """
+    done, _ = _run(df, feature_cols, window, registry, workers, pool, force, train=True, score=False)
+    return pd.DataFrame(done, columns=["device_id", "key", "trained", "n_rows"])
+
+
+@traced()
+def score_fleet(df: pd.DataFrame, feature_cols: Sequence[str], window: Optional[int] = None, registry=None,
+                workers: Optional[int] = None, pool: Optional[Executor] = None, train: bool = True) -> np.ndarray:
+    """Anomaly scores for every row of `df`, in `df` order, computed per device across a process pool.
+
+    Models missing or due for a retrain are fitted first, unless `train` is
+    False, in which case rows of devices without a model score NaN. Workers
+    write into a shared output array; the scores are put back in input order
+    with the permutation from pack().
+    """
+    _, (sorted_scores, order) = _run(df, feature_cols, window, registry, workers, pool, False, train, score=True)
+    scores = np.empty(len(df))
+    scores[order] = sorted_scores
+    return scores
+
+
+if __name__ == "__main__":
+    from backend.config import SENSOR_CSV
+    from backend.model_registry import ModelRegistry
+
+    parser = argparse.ArgumentParser(description="Retrain and score the whole fleet in parallel.")
+    parser.add_argument("--csv", default=str(SENSOR_CSV))
+    parser.add_argument("--features", default="temp_c,vibration,power_kw,occupancy")
+    parser.add_argument("--window", type=int, default=None, help="registry window key (default: rows per device)")
+    parser.add_argument("--workers", type=int, default=SHARD_WORKERS)
+    parser.add_argument("--model-dir", default=MODEL_DIR)
+    parser.add_argument("--force", action="store_true", help="refit every device")
+    parser.add_argument("--compare", action="store_true", help="also time a single-process run")
+    a = parser.parse_args()
+
+    data = pd.read_csv(a.csv)
+    feats = [c for c in a.features.split(",") if c in data.columns]
+    reg = ModelRegistry(a.model_dir)
+    runs = [("1 process", 1)] if a.compare else []
+    for label, n in runs + [(f"{a.workers} workers", a.workers)]:
+        t0 = time.perf_counter()
+        res = train_fleet(data, feats, a.window, reg, workers=n, force=a.force or a.compare)
+        t1 = time.perf_counter()
+        s = score_fleet(data, feats, a.window, reg, workers=n, train=False)
+        t2 = time.perf_counter()
+        print(f"{label}: trained {int(res['trained'].sum())}/{len(res)} devices in {t1 - t0:.2f}s, "
+              f"scored {len(s)} rows in {t2 - t1:.2f}s")
@@ -0,0 +1,106 @@
+import sys
+import pathlib
+sys.path.append(str(pathlib.Path(__file__).resolve().parent.parent))
+
+import argparse
+import ast
+import json
+import re
+import statistics
+import subprocess
+from pathlib import Path
+from typing import Dict, List, Optional
+
+ROOT = Path(__file__).resolve().parent.parent
+HEAVY = ["plotly", "sklearn", "chromadb", "sentence_transformers", "torch", "openai", "joblib"]
+
+# runs in a fresh interpreter; prints the import time and which heavy packages got loaded
+PROBE = """
+import json, sys, time
+sys.path.insert(0, {root!r})
+t0 = time.perf_counter()
+for name in {modules!r}:
+    try:
+        __import__(name)
+    except ImportError as e:
+        print(json.dumps({{"missing": str(e)}}), file=sys.stderr)
+elapsed = time.perf_counter() - t0
+print(json.dumps({{"seconds": elapsed, "loaded": [h for h in {heavy!r} if h in sys.modules]}}))
+"""
+
+
+def app_imports(path: Path = ROOT / "app.py") -> List[str]:
+    """Modules app.py imports at module level, i.e. before anything is painted."""
+    tree = ast.parse(path.read_text(encoding="utf-8"))
+    names = []
+    for node in tree.body:
+        if isinstance(node, ast.Import):
+            names.extend(a.name for a in node.names)
+        elif isinstance(node, ast.ImportFrom) and node.module and not node.level:
+            names.append(node.module)
+    return list(dict.fromkeys(names))
+
+
+def measure(modules: List[str], repeat: int = 5) -> dict:
+    """Median wall time of importing `modules` in `repeat` fresh interpreters."""
+    runs, loaded = [], []
+    for _ in range(repeat):
+        code = PROBE.format(root=str(ROOT), modules=list(modules), heavy=HEAVY)
+        out = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, cwd=ROOT)
+        if out.returncode:
+            raise RuntimeError(out.stderr.strip())
+        res = json.loads(out.stdout.strip().splitlines()[-1])
+        runs.append(res["seconds"])
+        loaded = res["loaded"]
+    return {"median_s": statistics.median(runs), "min_s": min(runs), "heavy_loaded": loaded}
+
+
+def importtime(modules: List[str], top: int = 15) -> List[dict]:
+    """Slowest top-level packages by summed self time from `python -X importtime`."""
+    code = f"import sys; sys.path.insert(0, {str(ROOT)!r})\n" + "".join(
+        f"try:\n    import {m}\nexcept ImportError:\n    pass\n" for m in modules)
+    out = subprocess.run([sys.executable, "-X", "importtime", "-c", code], capture_output=True, text=True, cwd=ROOT)
+    totals: Dict[str, int] = {}
+    for line in out.stderr.splitlines():
+        m = re.match(r"import time:\s+(\d+) \|\s+\d+ \|\s*(\S+)", line)
+        if m:
+            package = m.group(2).split(".")[0]
+            totals[package] = totals.get(package, 0) + int(m.group(1))
+    rows = [{"package": name, "self_ms": us / 1000} for name, us in totals.items()]
+    return sorted(rows, key=lambda r: -r["self_ms"])[:top]
+
+
+def run(repeat: int = 5, extra: Optional[List[str]] = None) -> Dict[str, dict]:
+    """Import cost of the app's first paint next to each heavy dependency on its own."""
+    first_paint = [m for m in app_imports() if m != "streamlit" or _available("streamlit")]
+    report = {"app first paint": {"modules": first_paint, **measure(first_paint, repeat)}}
+    for name in ["plotly.express", "sklearn.ensemble", "chromadb", "sentence_transformers"] + (extra or []):
+        if _available(name.split(".")[0]):
+            report[name] = measure([name], repeat)
+    return report
+
+
+def _available(name: str) -> bool:
+    from importlib.util import find_spec
+    return find_spec(name) is not None
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Measure the import cost of starting app.py.")
+    parser.add_argument("--repeat", type=int, default=5, help="fresh interpreters per measurement")
+    parser.add_argument("--module", action="append", default=[], help="also time this module on its own")
+    parser.add_argument("--importtime", type=int, default=0, metavar="N",
+                        help="list the N slowest packages behind the app's first paint")
+    parser.add_argument("--out", default=None, help="write the report as JSON")
+    a = parser.parse_args()
+
+    report = run(a.repeat, a.module)
+    for name, r in report.items():
+        heavy = ", ".join(r["heavy_loaded"]) or "none"
+        print(f"{name:<24} {r['median_s'] * 1000:8.0f} ms (min {r['min_s'] * 1000:.0f})  heavy: {heavy}")
+    if a.importtime:
+        print("\nslowest imports behind the first paint:")
+        for row in importtime(report["app first paint"]["modules"], a.importtime):
+            print(f"  {row['self_ms']:8.1f} ms  {row['package']}")
+    if a.out:
+        Path(a.out).write_text(json.dumps(report, indent=2))
@@ -0,0 +1,160 @@
+import io
+import os
+import threading
+from typing import Dict, Optional
+
+import numpy as np
+import pandas as pd
+
+from backend.metrics import traced
+
+
+class SensorTail:
+    """Incrementally reads an append-only sensor CSV.
+
+    Remembers the byte offset of the last complete line, parses only newly
+    appended rows and keeps the most recent `maxlen` rows per device in memory.
+    """
+
+    def __init__(self, path, maxlen: int = 5000, initial_bytes: int = 8 << 20):
+        self.path = str(path)
+        self.maxlen = maxlen
+        self.initial_bytes = initial_bytes
+        self._lock = threading.Lock()
+        self._reset()
+
+    def _reset(self):
+        self.offset = 0
+        self.header = None
+        self._head = b""
+        self.rows_read = 0
+        self._buffers: Dict[str, pd.DataFrame] = {}
+        self._ordered: Dict[str, bool] = {}
+        self._max_ts = None
+        self._frame: Optional[pd.DataFrame] = None
+
+    @traced("sensor_tail.poll")
+    def poll(self) -> pd.DataFrame:
+        """Parses rows appended since the last poll and returns them."""
+        with self._lock:
+            try:
+                size = os.path.getsize(self.path)
+            except OSError:
+                self._reset()
+                return pd.DataFrame()
+            with open(self.path, "rb") as f:
+                head = f.read(256)
+                if size < self.offset or head[:len(self._head)] != self._head:
+                    # file was truncated/rewritten (e.g. simulator restarted)
+                    self._reset()
+                if size == self.offset:
+                    return pd.DataFrame()
+                if self.header is None:
+                    self._head = head
+                    f.seek(0)
+                    first = f.readline()
+                    self.header = first.decode("utf-8").strip().split(",")
+                    self.offset = f.tell()
+                    # on a cold start over a large file only bootstrap from its tail
+                    if size - self.offset > self.initial_bytes:
+                        f.seek(size - self.initial_bytes)
+                        f.readline()
+                        self.offset = f.tell()
+                f.seek(self.offset)
+                data = f.read(size - self.offset)
+
+            end = data.rfind(b"\n")
+            if end < 0:
+                return pd.DataFrame()
+            self.offset += end + 1
+            new = pd.read_csv(io.BytesIO(data[:end + 1]), names=self.header, header=None)
+            if new.empty:
+                return new
+            if "timestamp" in new.columns:
+                new["timestamp"] = pd.to_datetime(new["timestamp"], format="ISO8601")
+            self.rows_read += len(new)
+            self._append(new)
+            return new
+
+    def _append(self, new: pd.DataFrame):
+        groups = new.groupby("device_id", sort=False) if "device_id" in new.columns else [(None, new)]
+        ts = new["timestamp"] if "timestamp" in new.columns else None
+        # a batch in time order that starts after everything seen so far keeps every buffer in time order
+        in_order = ts is not None and ts.is_monotonic_increasing \
+            and (self._max_ts is None or ts.iloc[0] >= self._max_ts)
+        if ts is not None:
+            self._max_ts = ts.max() if self._max_ts is None else max(self._max_ts, ts.max())
+        evicted: Optional[Dict[str, int]] = {}
+        for dev, g in groups:
+            buf = self._buffers.get(dev)
+            over = len(g) - self.maxlen
+            if buf is not None:
+                over += len(buf)
+                g = pd.concat([buf, g], ignore_index=True)
+            if evicted is not None and over > 0:
+                # the frame is sorted by time, the buffers by arrival: they only agree on
+                # which rows are oldest while the buffer is in timestamp order
+                if buf is None or over > len(buf) or not self._ordered[dev]:
+                    evicted = None
+                else:
+                    evicted[dev] = over
+            ordered = in_order and (buf is None or self._ordered[dev])
+            buf = g.tail(self.maxlen).reset_index(drop=True)
+            if not ordered and ts is not None:
+                # after late rows, checked again until they have been evicted
+                ordered = buf["timestamp"].is_monotonic_increasing
+            self._buffers[dev] = buf
+            self._ordered[dev] = ordered
+        self._frame = self._extend(self._frame, new, evicted)
+
+    @staticmethod
+    def _extend(frame: Optional[pd.DataFrame], new: pd.DataFrame,
+                evicted: Optional[Dict[str, int]]) -> Optional[pd.DataFrame]:
+        """Appends `new` to the cached frame and drops the rows the buffers evicted.
+
+        Evicted rows are each device's oldest, so they are found near the head
+        of the time-sorted frame and the update is one copy instead of a
+        concat and re-sort of every buffer. Returns None (full rebuild on the
+        next frame()) when rows arrive out of order or the frame cannot be patched.
+        """
+        if frame is None or evicted is None or not {"timestamp", "device_id"} <= set(new.columns):
+            return None
+        if new["device_id"].isna().any():
+            return None
+        new = new.sort_values("timestamp", kind="stable")
+        if len(frame) and new["timestamp"].iloc[0] < frame["timestamp"].iloc[-1]:
+            return None
+        if not evicted:
+            return pd.concat([frame, new], ignore_index=True)
+        size = min(len(frame), max(64, 2 * sum(evicted.values())))
+        while True:
+            head = frame["device_id"].iloc[:size].to_numpy()
+            drop = [np.flatnonzero(head == dev)[:n] for dev, n in evicted.items()]
+            if all(len(d) == n for d, n in zip(drop, evicted.values())):
+                break
+            if size == len(frame):
+                return None
+            size = min(len(frame), 2 * size)
+        keep = np.ones(size, dtype=bool)
+        keep[np.concatenate(drop)] = False
+        return pd.concat([frame.iloc[:size][keep], frame.iloc[size:], new], ignore_index=True)
+
+    def frame(self) -> Optional[pd.DataFrame]:
+        """Returns the buffered rows of all devices, sorted by timestamp.
+
+        Built once and then patched by each poll() that returns rows, so an
+        idle rerun costs nothing and a busy one costs a copy, not a re-sort.
+        """
+        with self._lock:
+            if not self._buffers:
+                return None
+            if self._frame is None:
+                df = pd.concat(self._buffers.values(), ignore_index=True)
+                if "timestamp" in df.columns:
+                    df = df.sort_values("timestamp", kind="stable").reset_index(drop=True)
+                self._frame = df
+            return self._frame
+
+    def device_frame(self, device_id: str) -> Optional[pd.DataFrame]:
+        with self._lock:
+            return self._buffers.get(device_id)
@@ -0,0 +1,238 @@
+import sys
+import pathlib
+sys.path.append(str(pathlib.Path(__file__).resolve().parent.parent))
+
+import threading
+import time
+from collections import deque
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional
+
+import numpy as np
+import pandas as pd
+
+from backend.models import AnomalyModel
+from backend.metrics import traced
+from backend.model_registry import ModelRegistry, get_registry
+
+FEATURES = ["temp_c", "vibration", "power_kw", "occupancy"]
+
+
+class P2Quantile:
+    """Streaming quantile estimate with the P² algorithm (Jain & Chlamtac), O(1) memory."""
+
+    def __init__(self, p: float):
+        self.p = p
+        self.count = 0
+        self.q: List[float] = []
+        self.n = [0, 1, 2, 3, 4]
+        self.np = [0.0, 2 * p, 4 * p, 2 + 2 * p, 4.0]
+        self.dn = [0.0, p / 2, p, (1 + p) / 2, 1.0]
+
+    @property
+    def value(self) -> float:
+        if self.count == 0:
+            return float("nan")
+        if self.count < 5:
+            return float(np.percentile(self.q, self.p * 100))
+        return self.q[2]
+
+    def update(self, x: float):
+        self.count += 1
+        q, n = self.q, self.n
+        if self.count <= 5:
+            q.append(x)
+            if self.count == 5:
+                q.sort()
+            return
+        if x < q[0]:
+            q[0] = x
+            k = 0
+        elif x >= q[4]:
+            q[4] = x
+            k = 3
+        else:
+            k = 0
+            while x >= q[k + 1]:
+                k += 1
+        for i in range(k + 1, 5):
+            n[i] += 1
+        for i in range(5):
+            self.np[i] += self.dn[i]
+        for i in (1, 2, 3):
+            d = self.np[i] - n[i]
+            if (d >= 1 and n[i + 1] - n[i] > 1) or (d <= -1 and n[i - 1] - n[i] < -1):
+                d = 1 if d > 0 else -1
+                qp = q[i] + d / (n[i + 1] - n[i - 1]) * (
+                    (n[i] - n[i - 1] + d) * (q[i + 1] - q[i]) / (n[i + 1] - n[i])
+                    + (n[i + 1] - n[i] - d) * (q[i] - q[i - 1]) / (n[i] - n[i - 1])
+                )
+                if not q[i - 1] < qp < q[i + 1]:
+                    qp = q[i] + d * (q[i + d] - q[i]) / (n[i + d] - n[i])
+                q[i] = qp
+                n[i] += d
+
+    def update_many(self, xs):
+        for x in np.asarray(xs, dtype=float).tolist():
+            self.update(x)
+
+
+@dataclass
+class _DeviceState:
+    sketch: P2Quantile
+    history: Optional[np.ndarray] = None
+    last: Optional[np.ndarray] = None
+    model: Optional[AnomalyModel] = None
+    since_check: int = 0
+    pending: List[pd.DataFrame] = field(default_factory=list)
+    pending_rows: int = 0
+    pending_since: float = 0.0
+
+
+class StreamingScorer:
+    """Scores sensor rows per device_id as they arrive and emits alerts.
+
+    Each device gets its own model from the registry (trained on its last
+    `train_rows` rows) and a P² sketch of its score distribution; a row alerts
+    when its score reaches the device's current `quantile` estimate. The sketch
+    is reseeded whenever the device's model is refit. With `min_batch` > 1 rows
+    are buffered per device so the fixed cost of each IsolationForest call is
+    amortised over larger micro-batches.
+    """
+
+    def __init__(self, registry: Optional[ModelRegistry] = None, feature_cols=None,
+                 quantile: float = 0.98, train_rows: int = 900, min_train: int = 80,
+                 check_every: int = 500, min_batch: int = 1, max_latency: float = 1.0,
+                 keep_scored: int = 5000, keep_alerts: int = 500):
+        self.registry = registry or get_registry()
+        self.features = list(feature_cols or FEATURES)
+        self.quantile = quantile
+        self.train_rows = train_rows
+        self.min_train = min_train
+        self.check_every = check_every
+        self.min_batch = min_batch
+        self.max_latency = max_latency
+        self.keep_scored = keep_scored
+        self.devices: Dict[str, _DeviceState] = {}
+        self.alerts = deque(maxlen=keep_alerts)
+        self._scored = deque()
+        self._scored_rows = 0
+        self._lock = threading.Lock()
+
+    @traced("scorer.push")
+    def push(self, batch: pd.DataFrame) -> pd.DataFrame:
+        """Adds new rows and returns the ones that crossed their device threshold."""
+        out = []
+        with self._lock:
+            now = time.monotonic()
+            if batch is not None and len(batch):
+                for dev, g in batch.groupby("device_id", sort=False):
+                    st = self.devices.get(dev)
+                    if st is None:
+                        st = self.devices[dev] = _DeviceState(sketch=P2Quantile(self.quantile))
+                    if not st.pending:
+                        st.pending_since = now
+                    st.pending.append(g)
+                    st.pending_rows += len(g)
+            for dev, st in self.devices.items():
+                if st.pending and (st.pending_rows >= self.min_batch or now - st.pending_since >= self.max_latency):
+                    out.append(self._score_device(dev, st))
+        return self._collect(out)
+
+    def flush(self) -> pd.DataFrame:
+        with self._lock:
+            out = [self._score_device(dev, st) for dev, st in self.devices.items() if st.pending]
+        return self._collect(out)
+
+    def _collect(self, out) -> pd.DataFrame:
+        out = [a for a in out if a is not None and len(a)]
+        if not out:
+            return pd.DataFrame()
+        alerts = pd.concat(out, ignore_index=True)
+        self.alerts.extend(alerts.to_dict("records"))
+        return alerts
+
+    def _score_device(self, dev: str, st: _DeviceState) -> Optional[pd.DataFrame]:
+        g = st.pending[0] if len(st.pending) == 1 else pd.concat(st.pending, ignore_index=True)
+        st.pending, st.pending_rows = [], 0
+
+        X = g[self.features].to_numpy(dtype=float)
+        if np.isnan(X).any():
+            # forward-fill from this device's previous row only
+            head = st.last[None, :] if st.last is not None else np.full((1, X.shape[1]), np.nan)
+            X = pd.DataFrame(np.vstack([head, X])).ffill().fillna(0.0).to_numpy()[1:]
+        st.last = X[-1]
+        st.history = (X if st.history is None else np.vstack([st.history, X]))[-self.train_rows:]
+        if len(st.history) < self.min_train:
+            return None
+
+        st.since_check += len(X)
+        # the first model is fit on min_train rows; it is refit once the full train_rows window is there
+        partial = st.model is not None and st.model.n_samples < self.train_rows <= len(st.history)
+        if st.model is None or partial or st.since_check >= self.check_every:
+            st.since_check = 0
+            hist = pd.DataFrame(st.history, columns=self.features)
+            model = self.registry.get_or_train(hist, device=dev, feature_cols=self.features,
+                                               window=self.train_rows)
+            if model.n_samples < self.train_rows <= len(st.history):
+                model = self.registry.get_or_train(hist, device=dev, feature_cols=self.features,
+                                                   window=self.train_rows, force=True)
+            if model is not st.model:
+                st.model = model
+                st.sketch = P2Quantile(self.quantile)
+                st.sketch.update_many(-model.model.score_samples(st.history))
+
+        scores = -st.model.model.score_samples(X)
+        threshold = st.sketch.value
+        st.sketch.update_many(scores)
+
+        scored = g.assign(anomaly_score=scores, threshold=threshold)
+        self._scored.append(scored)
+        self._scored_rows += len(scored)
+        while self._scored_rows - len(self._scored[0]) >= self.keep_scored:
+            self._scored_rows -= len(self._scored.popleft())
+        return scored[scores >= threshold]
+
+    def recent_scores(self, n: Optional[int] = None) -> pd.DataFrame:
+        with self._lock:
+            if not self._scored:
+                return pd.DataFrame()
+            df = pd.concat(list(self._scored), ignore_index=True)
+        if "timestamp" in df.columns:
+            df = df.sort_values("timestamp", kind="stable").reset_index(drop=True)
+        return df.tail(n) if n else df
+
+    def recent_alerts(self, n: Optional[int] = None) -> pd.DataFrame:
+        with self._lock:
+            rows = list(self.alerts)
+        df = pd.DataFrame(rows)
+        return df.tail(n) if n else df
+
+
+if __name__ == "__main__":
+    import argparse
+    from backend.config import SENSOR_CSV
+    from backend.stream_reader import SensorTail
+
+    p = argparse.ArgumentParser(description="Headless streaming anomaly scorer")
+    p.add_argument("--csv", type=str, default=str(SENSOR_CSV))
+    p.add_argument("--interval", type=float, default=1.0)
+    p.add_argument("--min-batch", type=int, default=256)
+    p.add_argument("--once", action="store_true", help="score what is in the file and exit")
+    a = p.parse_args()
+
+    tail = SensorTail(a.csv, maxlen=1)
+    scorer = StreamingScorer(min_batch=a.min_batch, max_latency=a.interval)
+    while True:
+        t0 = time.perf_counter()
+        new = tail.poll()
+        alerts = scorer.push(new)
+        if a.once:
+            alerts = pd.concat([alerts, scorer.flush()], ignore_index=True)
+        for _, row in alerts.iterrows():
+            print(f"{row['timestamp']} {row['device_id']} score={row['anomaly_score']:.3f} "
+                  f"threshold={row['threshold']:.3f}")
+        if a.once:
+            print(f"Scored {tail.rows_read} rows in {time.perf_counter() - t0:.2f}s, {len(scorer.alerts)} alerts")
+            break
+        time.sleep(a.interval)
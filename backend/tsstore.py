@@ -0,0 +1,340 @@
+import json
+import os
+import threading
+import time
+import uuid
+from datetime import timedelta
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
+
+from backend.config import SENSOR_STORE, STORE_COMPACT_FILES
+
+SCHEMA = pa.schema([
+    ("timestamp", pa.timestamp("us")),
+    ("device_id", pa.string()),
+    ("temp_c", pa.float64()),
+    ("vibration", pa.float64()),
+    ("power_kw", pa.float64()),
+    ("occupancy", pa.int64()),
+])
+
+
+REPLACES_KEY = b"replaces"  # Parquet metadata of a merged part: names of the parts it supersedes
+
+
+def _safe(device_id: str) -> str:
+    return str(device_id).replace("/", "_").replace(os.sep, "_")
+
+
+def _max_timestamp(meta: pq.FileMetaData) -> Optional[pd.Timestamp]:
+    """Newest timestamp in a part file from its row-group statistics (column 0), or None."""
+    best = None
+    for rg in range(meta.num_row_groups):
+        stats = meta.row_group(rg).column(0).statistics
+        if stats is not None and stats.has_min_max:
+            mx = pd.Timestamp(stats.max)
+            best = mx if best is None or mx > best else best
+    return best
+
+
+class TimeSeriesStore:
+    """Parquet sensor store partitioned as date=YYYY-MM-DD/device_id=<id>/part-*.parquet.
+
+    Readers prune partitions from the directory names before touching any
+    file, so a time range for one device only opens that device's files for
+    the days involved. Files are memory-mapped and timestamps are filtered
+    by Arrow, not reparsed from strings.
+
+    Every write() adds one level-0 part file per partition. Compaction is
+    tiered: once a partition holds `compact_files` parts of one level they
+    are merged into a single part of the next level, so each row is rewritten
+    about log_{compact_files}(rows) times rather than on every merge. A merged
+    part lists the parts it replaces in its Parquet metadata and readers skip
+    those, so a reader never sees rows twice while the old parts are removed.
+    """
+
+    def __init__(self, root=SENSOR_STORE, compact_files: int = STORE_COMPACT_FILES):
+        self.root = Path(root)
+        self.compact_files = compact_files
+        # part files never change once written: their footer facts are kept per partition
+        self._footers: Dict[Path, Dict[str, tuple]] = {}
+
+    # ---- Writer ----
+    def write(self, df: pd.DataFrame) -> int:
+        if df is None or len(df) == 0:
+            return 0
+        df = df.copy()
+        df["timestamp"] = pd.to_datetime(df["timestamp"], format="ISO8601")
+        day = df["timestamp"].to_numpy().astype("datetime64[D]")
+        cols = [n for n in SCHEMA.names if n != "device_id"]
+        for (d, dev), g in df.groupby([day, "device_id"], sort=False):
+            part = self.root / f"date={np.datetime64(d, 'D')}" / f"device_id={_safe(dev)}"
+            part.mkdir(parents=True, exist_ok=True)
+            g = g.reindex(columns=cols).sort_values("timestamp", kind="stable")
+            self._write_part(part, pa.Table.from_pandas(g, schema=SCHEMA.remove(1), preserve_index=False))
+            # small API batches would otherwise pile up one file per call
+            if self.compact_files:
+                self._compact_partition(part)
+        return len(df)
+
+    @staticmethod
+    def _level(f: Path) -> int:
+        # part-L<level>-<ns>-<id>.parquet; older part-<ns>-<id>.parquet files are level 0
+        tag = f.name.split("-")[1]
+        return int(tag[1:]) if tag.startswith("L") else 0
+
+    @staticmethod
+    def _write_part(part: Path, table: pa.Table, level: int = 0, replaces: Iterable[Path] = ()):
+        name = f"part-L{level}-{time.time_ns()}-{uuid.uuid4().hex[:8]}.parquet"
+        replaces = [f.name for f in replaces]
+        if replaces:
+            table = table.replace_schema_metadata({**(table.schema.metadata or {}),
+                                                   REPLACES_KEY: json.dumps(replaces).encode()})
+        tmp = part / f".{name}.tmp"
+        pq.write_table(table, tmp, compression="zstd")
+        os.replace(tmp, part / name)
+
+    def _merge(self, part: Path, files: List[Path], level: int):
+        tables = [pq.read_table(f, memory_map=True) for f in files]
+        # keep the pandas metadata, drop the inputs' own "replaces" lists
+        tables = [t.replace_schema_metadata({k: v for k, v in (t.schema.metadata or {}).items() if k != REPLACES_KEY})
+                  for t in tables]
+        table = pa.concat_tables(tables)
+        self._write_part(part, table.sort_by("timestamp"), level, replaces=files)
+        for f in files:
+            f.unlink(missing_ok=True)
+
+    def _compact_partition(self, part: Path):
+        by_level: Dict[int, List[Path]] = {}
+        for f in sorted(part.glob("part-*.parquet")):
+            by_level.setdefault(self._level(f), []).append(f)
+        level = 0
+        while len(by_level.get(level, [])) >= self.compact_files:
+            self._merge(part, by_level[level], level + 1)
+            level += 1
+            by_level[level] = sorted(part.glob(f"part-L{level}-*.parquet"))
+
+    def compact(self, day: Optional[str] = None):
+        """Merges all part files of each partition (optionally only one day) into one."""
+        for part in self._partitions(days=[day] if day else None):
+            files = sorted(part.glob("part-*.parquet"))
+            if len(files) > 1:
+                self._merge(part, files, max(self._level(f) for f in files) + 1)
+
+    # ---- Reader ----
+    def days(self) -> List[str]:
+        if not self.root.exists():
+            return []
+        return sorted(p.name[5:] for p in self.root.glob("date=*") if p.is_dir())
+
+    def devices(self, day: Optional[str] = None) -> List[str]:
+        days = [day] if day else self.days()
+        return sorted({p.name[10:] for d in days for p in (self.root / f"date={d}").glob("device_id=*")})
+
+    def _partitions(self, days: Optional[Iterable[str]] = None, devices: Optional[Iterable[str]] = None):
+        wanted = None if devices is None else {_safe(d) for d in devices}
+        for d in (self.days() if days is None else days):
+            day_dir = self.root / f"date={d}"
+            if wanted is None:
+                yield from sorted(p for p in day_dir.glob("device_id=*") if p.is_dir())
+            else:
+                for dev in sorted(wanted):
+                    p = day_dir / f"device_id={dev}"
+                    if p.is_dir():
+                        yield p
+
+    def read_table(self, start=None, end=None, devices: Optional[Iterable[str]] = None,
+                   columns: Optional[List[str]] = None) -> pa.Table:
+        start = pd.Timestamp(start) if start is not None else None
+        end = pd.Timestamp(end) if end is not None else None
+        days = [d for d in self.days()
+                if (start is None or d >= start.strftime("%Y-%m-%d"))
+                and (end is None or d <= end.strftime("%Y-%m-%d"))]
+        cols = [c for c in (columns or SCHEMA.names) if c != "device_id"]
+        if "timestamp" not in cols:
+            cols = ["timestamp"] + cols
+        tables = []
+        for part in self._partitions(days, devices):
+            dev = part.name[10:]
+            for t in self._read_parts(part, cols, start):
+                mask = None
+                if start is not None:
+                    mask = pc.greater_equal(t["timestamp"], pa.scalar(start.to_datetime64(), pa.timestamp("us")))
+                if end is not None:
+                    m = pc.less(t["timestamp"], pa.scalar(end.to_datetime64(), pa.timestamp("us")))
+                    mask = m if mask is None else pc.and_(mask, m)
+                if mask is not None:
+                    t = t.filter(mask)
+                if t.num_rows:
+                    tables.append(t.append_column("device_id", pa.array([dev] * t.num_rows, pa.string())))
+        if not tables:
+            return SCHEMA.empty_table().select(cols + ["device_id"])
+        return pa.concat_tables(tables)
+
+    def _footer(self, part: Path, files: List[Path]) -> Dict[str, tuple]:
+        """(newest timestamp, replaced part names) of each file, reading only unseen footers."""
+        known = self._footers.get(part, {})
+        footers = {}
+        for f in files:
+            if f.name not in known:
+                pf = pq.ParquetFile(f)
+                meta = pf.schema_arrow.metadata or {}
+                known[f.name] = (_max_timestamp(pf.metadata), json.loads(meta.get(REPLACES_KEY, b"[]")))
+            footers[f.name] = known[f.name]
+        self._footers[part] = footers
+        return footers
+
+    def _read_parts(self, part: Path, cols: List[str], start: Optional[pd.Timestamp] = None) -> List[pa.Table]:
+        """The live parts of a partition: parts a merged part replaces are left out.
+
+        Parts whose newest row (from the footer statistics) is before `start`
+        are not read at all.
+        """
+        while True:
+            try:
+                files = sorted(part.glob("part-*.parquet"))
+                footers = self._footer(part, files)
+                replaced = {name for _, names in footers.values() for name in names}
+                return [pq.ParquetFile(f, memory_map=True).read(columns=cols) for f in files
+                        if f.name not in replaced
+                        and (start is None or footers[f.name][0] is None or footers[f.name][0] >= start)]
+            except FileNotFoundError:
+                continue  # a compaction removed a part after it was listed; list again
+
+    def read(self, start=None, end=None, devices: Optional[Iterable[str]] = None,
+             columns: Optional[List[str]] = None) -> pd.DataFrame:
+        df = self.read_table(start, end, devices, columns).to_pandas()
+        cols = ["timestamp", "device_id"] + [c for c in df.columns if c not in ("timestamp", "device_id")]
+        return df[cols].sort_values("timestamp", kind="stable").reset_index(drop=True)
+
+    @staticmethod
+    def _newest(part: Path) -> Optional[pd.Timestamp]:
+        best = None
+        for f in part.glob("part-*.parquet"):
+            try:
+                mx = _max_timestamp(pq.ParquetFile(f).metadata)
+            except FileNotFoundError:
+                continue
+            if mx is not None and (best is None or mx > best):
+                best = mx
+        return best
+
+    def latest_by_device(self, devices: Optional[Iterable[str]] = None) -> Dict[str, pd.Timestamp]:
+        """Newest timestamp per device, from Parquet column statistics.
+
+        Days are scanned newest first and a device is settled by the first day
+        that has data for it, so a device that went quiet is still found.
+        """
+        wanted = None if devices is None else {_safe(d) for d in devices}
+        out: Dict[str, pd.Timestamp] = {}
+        for day in reversed(self.days()):
+            todo = None if wanted is None else wanted - set(out)
+            if todo is not None and not todo:
+                break
+            for part in self._partitions([day], todo):
+                dev = part.name[10:]
+                if dev not in out:
+                    ts = self._newest(part)
+                    if ts is not None:
+                        out[dev] = ts
+        return out
+
+    def latest(self, devices: Optional[Iterable[str]] = None) -> Optional[pd.Timestamp]:
+        """Newest timestamp of the given devices, or of the whole store."""
+        if devices is None:
+            # the newest day holds the newest row overall
+            newest = [self._newest(p) for p in self._partitions(self.days()[-1:])]
+            newest = [t for t in newest if t is not None]
+            return max(newest) if newest else None
+        by_device = self.latest_by_device(devices)
+        return max(by_device.values()) if by_device else None
+
+    def tail(self, seconds: float, devices: Optional[Iterable[str]] = None) -> pd.DataFrame:
+        """Rows within `seconds` of the newest stored timestamp.
+
+        With `devices`, each device gets the window ending at its own newest
+        row, so a device without data on the newest day still returns rows.
+        """
+        if devices is None:
+            end = self.latest()
+            if end is None:
+                return self.read().iloc[0:0]
+            return self.read(start=end - timedelta(seconds=seconds))
+        ends = self.latest_by_device(devices)
+        if not ends:
+            return self.read(devices=devices).iloc[0:0]
+        window = timedelta(seconds=seconds)
+        df = self.read(start=min(ends.values()) - window, devices=list(ends))
+        start = df["device_id"].map({dev: end - window for dev, end in ends.items()})
+        return df[df["timestamp"] >= start].reset_index(drop=True)
+
+
+class StoreTail:
+    """Keeps the last `seconds` of a TimeSeriesStore in memory.
+
+    The store counterpart of stream_reader.SensorTail: remembers the newest
+    timestamp seen per device and each poll() reads only rows newer than
+    that. New rows only ever arrive as new part files, so a partition whose
+    directory is unchanged since the last poll is skipped unlisted, and in a
+    changed one the parts already consumed are skipped from their footers.
+    """
+
+    def __init__(self, store: TimeSeriesStore, seconds: float = 3600):
+        self.store = store
+        self.window = timedelta(seconds=seconds)
+        self._lock = threading.Lock()
+        self._cursor: Dict[str, pd.Timestamp] = {}
+        self._mtimes: Dict[Path, int] = {}
+        self._frame: Optional[pd.DataFrame] = None
+
+    def poll(self) -> pd.DataFrame:
+        """Reads rows stored since the last poll and returns them."""
+        with self._lock:
+            # stat before reading: a part added meanwhile shows up on the next poll
+            start = min(self._cursor.values()) if self._cursor else None
+            changed = self._changed(start)
+            if self._frame is None:
+                new = self.store.tail(self.window.total_seconds())
+            elif not changed:
+                return self._frame.iloc[0:0]
+            else:
+                # rows at the oldest cursor were seen by every device that has one
+                new = self.store.read(start=start + pd.Timedelta(1, "us"), devices=changed)
+                seen = new["device_id"].map(self._cursor)
+                new = new[seen.isna() | (new["timestamp"] > seen)].reset_index(drop=True)
+            if len(new) == 0:
+                return new
+            self._cursor.update(new.groupby("device_id", sort=False)["timestamp"].max().to_dict())
+            df = new if self._frame is None else pd.concat([self._frame, new], ignore_index=True)
+            df = df.sort_values("timestamp", kind="stable")
+            self._frame = df[df["timestamp"] >= df["timestamp"].iloc[-1] - self.window].reset_index(drop=True)
+            return new
+
+    def _changed(self, start: Optional[pd.Timestamp]) -> List[str]:
+        """Devices with a partition modified since the last poll, from `start`'s day on."""
+        days = self.store.days()
+        if start is not None:
+            days = [d for d in days if d >= start.strftime("%Y-%m-%d")]
+        changed = set()
+        for part in self.store._partitions(days):
+            try:
+                mtime = part.stat().st_mtime_ns
+            except FileNotFoundError:
+                continue
+            if self._mtimes.get(part) != mtime:
+                self._mtimes[part] = mtime
+                changed.add(part.name[10:])
+        return sorted(changed)
+
+    def frame(self) -> Optional[pd.DataFrame]:
+        """The buffered rows of all devices, sorted by timestamp."""
+        with self._lock:
+            if self._frame is None or len(self._frame) == 0:
+                return None
+            return self._frame
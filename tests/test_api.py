@@ -0,0 +1,55 @@
+import asyncio
+
+import pandas as pd
+import pytest
+from fastapi.testclient import TestClient
+
+from backend import api
+
+
+@pytest.fixture
+def client(tmp_path, monkeypatch):
+    # no lifespan: /ingest only needs the write lock, not the pool or the retriever
+    monkeypatch.setattr(api, "SENSOR_BACKEND", "csv")
+    monkeypatch.setattr(api, "SENSOR_CSV", tmp_path / "sensor_stream.csv")
+    monkeypatch.setattr(api.state, "write_lock", asyncio.Lock(), raising=False)
+    return TestClient(api.app)
+
+
+def _row(ts, device="AHU-1"):
+    return {"timestamp": ts, "device_id": device, "temp_c": 21.0, "vibration": 0.1,
+            "power_kw": 5.0, "occupancy": 0.5}
+
+
+def test_ingest_rejects_invalid_timestamps(client):
+    resp = client.post("/ingest", json={"rows": [_row("2024-01-01T10:00:00"), _row("yesterday")]})
+    assert resp.status_code == 422
+    assert resp.json()["detail"]["rows"] == [{"row": 1, "timestamp": "yesterday"}]
+
+
+def test_ingest_mixed_offsets_are_stored_as_utc(client):
+    rows = [_row("2024-01-01T12:00:00+02:00"), _row("2024-01-01T10:00:01Z"), _row("2024-01-01T10:00:02")]
+    resp = client.post("/ingest", json={"rows": rows})
+    assert resp.status_code == 200 and resp.json() == {"ingested": 3}
+    stored = pd.read_csv(api.SENSOR_CSV)["timestamp"].tolist()
+    assert stored == ["2024-01-01T10:00:00.000000", "2024-01-01T10:00:01.000000", "2024-01-01T10:00:02.000000"]
+
+
+def test_anomalies_trains_each_device_on_its_own_rows(client, tmp_path, monkeypatch):
+    from backend import model_registry
+    from backend.stream_reader import SensorTail
+    registry = model_registry.ModelRegistry(tmp_path / "models")
+    monkeypatch.setattr(model_registry, "_registry", registry)
+    monkeypatch.setattr(api, "API_WORKERS", 1)
+    monkeypatch.setattr(api.state, "tail", SensorTail(api.SENSOR_CSV), raising=False)
+    monkeypatch.setattr(api.state, "pool", None, raising=False)
+    start = pd.Timestamp("2024-01-01")
+    rows = [_row((start + pd.Timedelta(seconds=s)).isoformat(), device)
+            for s in range(400) for device in ("AHU-1", "AHU-2", "CH-1")]
+    assert client.post("/ingest", json={"rows": rows}).status_code == 200
+
+    resp = client.get("/anomalies", params={"window": 50, "train_rows": 300})
+    assert resp.status_code == 200 and len(resp.json()["rows"]) == 50
+    for device in ("AHU-1", "AHU-2", "CH-1"):
+        model = registry.get(registry.key(api.FEATURES, device, 300))
+        assert model.n_samples == 300
@@ -0,0 +1,14 @@
+import base64
+import io
+import os
+
+from backend.chunker import iter_chunks
+
+
+def test_run_without_whitespace_is_cut_at_the_char_cap():
+    blob = base64.b64encode(os.urandom(75_000)).decode()  # 100k characters, one "token"
+    text = f"Intro sentence here. {blob} Closing words.\n"
+    chunks = list(iter_chunks(io.StringIO(text, newline=""), max_tokens=200, max_chars=1600))
+    assert max(len(c.text) for c in chunks) <= 1600
+    assert all(text[c.start:c.end] == c.text for c in chunks)
+    assert "".join(c.text for c in chunks).replace(" ", "") == text.strip().replace(" ", "")
@@ -0,0 +1,144 @@
+import asyncio
+import hashlib
+import json
+import re
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import numpy as np
+import pytest
+
+from backend import llm
+
+ANSWER = "1. Check the fan belt tension (hvac_manual.txt)."
+
+
+class _StubOpenAI(BaseHTTPRequestHandler):
+    """Answers /v1/chat/completions like the OpenAI API, streamed or not."""
+
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        self.server.requests.append(body)
+        answer = self.server.answer
+        if body.get("stream"):
+            self.send_response(200)
+            self.send_header("Content-Type", "text/event-stream")
+            self.end_headers()
+            for piece in re.findall(r"\S+\s*", answer):
+                chunk = {"id": "stub", "object": "chat.completion.chunk", "created": 0, "model": body["model"],
+                         "choices": [{"index": 0, "delta": {"content": piece}, "finish_reason": None}]}
+                self.wfile.write(f"data: {json.dumps(chunk)}\n\n".encode())
+            self.wfile.write(b"data: [DONE]\n\n")
+            return
+        payload = json.dumps({
+            "id": "stub", "object": "chat.completion", "created": 0, "model": body["model"],
+            "choices": [{"index": 0, "message": {"role": "assistant", "content": answer}, "finish_reason": "stop"}],
+            "usage": {"prompt_tokens": 1, "completion_tokens": 1, "total_tokens": 2},
+        }).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, *args):
+        pass
+
+
+def _bow_embed(question):
+    # bag-of-words vector, so near-identical wordings have a high cosine similarity
+    v = np.zeros(256, dtype=np.float32)
+    for w in re.findall(r"\w+", question.lower()):
+        v[int(hashlib.md5(w.encode()).hexdigest(), 16) % 256] += 1.0
+    return v / (np.linalg.norm(v) or 1.0)
+
+
+@pytest.fixture
+def stub(monkeypatch):
+    server = ThreadingHTTPServer(("127.0.0.1", 0), _StubOpenAI)
+    server.requests, server.answer = [], ANSWER
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    monkeypatch.setattr(llm, "OPENAI_API_KEY", "test-key")
+    monkeypatch.setattr(llm, "OPENAI_BASE_URL", f"http://127.0.0.1:{server.server_port}/v1")
+    monkeypatch.setattr(llm, "_client", None)
+    monkeypatch.setattr(llm, "_async_client", None)
+    monkeypatch.setattr(llm, "_cache", llm.ResponseCache(size=16, similarity=0))
+    monkeypatch.setattr(llm.ResponseCache, "_embed", staticmethod(_bow_embed))
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+CONTEXTS = ["Inspect the fan belt.", "Check bearing lubrication."]
+IDS = ["hvac_manual-1", "hvac_manual-2"]
+
+
+def test_sync_call_and_exact_cache_hit(stub):
+    assert llm.llm_summarize("AHU vibration is high?", CONTEXTS, context_ids=IDS) == ANSWER
+    assert len(stub.requests) == 1
+    assert stub.requests[0]["messages"][0]["content"] == llm.SYSTEM_PROMPT
+    # same question up to case, whitespace and punctuation, same chunks: served from the cache
+    assert llm.llm_summarize("  ahu vibration is HIGH ", CONTEXTS, context_ids=IDS) == ANSWER
+    assert len(stub.requests) == 1
+    # different retrieved chunks: a new request
+    llm.llm_summarize("AHU vibration is high?", CONTEXTS, context_ids=IDS[:1])
+    assert len(stub.requests) == 2
+
+
+def test_before_request_runs_only_on_cache_miss(stub):
+    calls = []
+    llm.llm_summarize("AHU vibration is high?", CONTEXTS, context_ids=IDS, before_request=lambda: calls.append(1))
+    llm.llm_summarize("AHU vibration is high?", CONTEXTS, context_ids=IDS, before_request=lambda: calls.append(1))
+    assert len(calls) == 1 and len(stub.requests) == 1
+
+
+def test_stream_and_cache_hit(stub):
+    parts = list(llm.llm_summarize_stream("Chiller short cycling", CONTEXTS, context_ids=IDS))
+    assert len(parts) > 1 and "".join(parts) == ANSWER
+    assert stub.requests[0]["stream"] is True
+    assert list(llm.llm_summarize_stream("Chiller short cycling", CONTEXTS, context_ids=IDS)) == [ANSWER]
+    assert len(stub.requests) == 1
+
+
+def test_empty_stream_is_not_cached(stub):
+    stub.answer = ""
+    assert list(llm.llm_summarize_stream("Chiller short cycling", CONTEXTS, context_ids=IDS)) == []
+    stub.answer = ANSWER
+    assert "".join(llm.llm_summarize_stream("Chiller short cycling", CONTEXTS, context_ids=IDS)) == ANSWER
+    assert len(stub.requests) == 2
+
+
+def test_async_calls(stub):
+    async def run():
+        answer = await llm.allm_summarize("Damper stuck open", CONTEXTS, context_ids=IDS)
+        streamed = [p async for p in llm.allm_summarize_stream("Valve leaking", CONTEXTS, context_ids=IDS)]
+        cached = await llm.allm_summarize("damper stuck open", CONTEXTS, context_ids=IDS)
+        return answer, streamed, cached
+
+    answer, streamed, cached = asyncio.run(run())
+    assert answer == ANSWER and cached == ANSWER
+    assert "".join(streamed) == ANSWER
+    assert len(stub.requests) == 2
+
+
+def test_semantic_cache_is_off_by_default(stub, monkeypatch):
+    # the cache as the module builds it when LLM_CACHE_SIM is unset
+    default = llm.ResponseCache()
+    assert default.similarity == 0
+    monkeypatch.setattr(llm, "_cache", default)
+    llm.llm_summarize("What should I check first for AHU vibration", CONTEXTS, context_ids=IDS)
+    llm.llm_summarize("What should I check first for AHU vibration today", CONTEXTS, context_ids=IDS)
+    assert len(stub.requests) == 2
+
+
+def test_semantic_cache_hit(stub, monkeypatch):
+    monkeypatch.setattr(llm, "_cache", llm.ResponseCache(size=16, similarity=0.9))
+    llm.llm_summarize("What should I check first for AHU vibration", CONTEXTS, context_ids=IDS)
+    # one extra word: cosine 0.95 >= 0.9, answered from the cache
+    assert llm.llm_summarize("What should I check first for AHU vibration today", CONTEXTS,
+                             context_ids=IDS) == ANSWER
+    assert len(stub.requests) == 1
+    # unrelated question with the same chunks still goes to the model
+    llm.llm_summarize("How often should chiller tubes be cleaned", CONTEXTS, context_ids=IDS)
+    assert len(stub.requests) == 2
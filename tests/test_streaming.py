@@ -0,0 +1,16 @@
+import numpy as np
+import pandas as pd
+
+from backend.model_registry import ModelRegistry
+from backend.streaming import StreamingScorer
+
+
+def test_cold_start_batch_is_capped_at_train_rows(tmp_path):
+    scorer = StreamingScorer(registry=ModelRegistry(tmp_path), train_rows=900)
+    rng = np.random.default_rng(0)
+    batch = pd.DataFrame({"timestamp": pd.date_range("2024-01-01", periods=1000, freq="s"), "device_id": "AHU-1",
+                          **{f: rng.random(1000) for f in ["temp_c", "vibration", "power_kw", "occupancy"]}})
+    scorer.push(batch)
+    state = scorer.devices["AHU-1"]
+    assert len(state.history) == 900
+    assert state.model.n_samples == 900
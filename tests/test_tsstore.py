@@ -0,0 +1,57 @@
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from backend.tsstore import StoreTail, TimeSeriesStore
+
+START = pd.Timestamp("2024-01-01")
+
+
+def _rows(first, n=1, device="AHU-1"):
+    return pd.DataFrame({"timestamp": [START + pd.Timedelta(seconds=first + i) for i in range(n)],
+                         "device_id": device, "temp_c": 21.0, "vibration": 0.1, "power_kw": 5.0, "occupancy": 1})
+
+
+def _parts(store):
+    return sorted(store.root.glob("date=*/device_id=*/part-*.parquet"))
+
+
+def test_compaction_is_tiered(tmp_path):
+    store = TimeSeriesStore(tmp_path, compact_files=4)
+    for i in range(20):
+        store.write(_rows(i))
+    # every 4 level-0 parts became a level-1 part; 4 of those became one level-2 part
+    assert sorted(TimeSeriesStore._level(f) for f in _parts(store)) == [1, 2]
+    df = store.read()
+    assert len(df) == 20 and df["timestamp"].is_unique
+
+
+def test_replaced_parts_are_not_read_twice(tmp_path):
+    store = TimeSeriesStore(tmp_path, compact_files=0)
+    for i in range(3):
+        store.write(_rows(i))
+    parts = _parts(store)
+    # a merge that has written its output but not yet removed its inputs
+    merged = pa.concat_tables([pq.read_table(p) for p in parts])
+    store._write_part(parts[0].parent, merged, level=1, replaces=parts)
+    assert len(_parts(store)) == 4
+    assert len(store.read()) == 3
+
+
+def test_store_tail_reads_only_new_rows(tmp_path, monkeypatch):
+    store = TimeSeriesStore(tmp_path, compact_files=0)
+    store.write(pd.concat([_rows(0, 10), _rows(0, 10, "AHU-2")]))
+    tail = StoreTail(store, seconds=5)
+    assert len(tail.poll()) == 12  # the last 5 seconds of both devices
+    # a late batch from one device older than the other device's newest row
+    store.write(pd.concat([_rows(10, 2), _rows(8, 4, "AHU-2")]))
+    reads = []
+    real = pq.ParquetFile.read
+    monkeypatch.setattr(pq.ParquetFile, "read", lambda self, *a, **k: reads.append(self) or real(self, *a, **k))
+    new = tail.poll()
+    assert len(reads) == 2  # only the new parts; the first ones are older than the cursor
+    assert sorted(new["device_id"]) == ["AHU-1", "AHU-1", "AHU-2", "AHU-2"]
+    assert len(tail.poll()) == 0
+    frame = tail.frame()
+    assert frame["timestamp"].min() == START + pd.Timedelta(seconds=6)
+    assert frame["timestamp"].is_monotonic_increasing and len(frame) == 12